@@ -22,8 +22,17 @@ for all non-sink beads in the BDD we need to assign keys k_true and k_false for
 the sink nodes that are strictly less than all other keys in the structure. I
 guess we can do this by convention, by always ensuring the True sink has key 1,
 and the False sink has key 0.
+
+A BDD is a dict with the number of beads s and the dag of beads. The dag may
+be a plain dict or a bead_table.BeadTable; the functions below also accept a
+BeadTable or dict of beads on its own in place of the BDD dict.
 """
 
+import hashlib
+import struct
+
+from bead_table import BeadTable
+
 BDD_X = dict(
     s = 9,
     dag = {8:(1,7,6), 7:(2,5,4), 6:(2,0,1), 5:(3,1,0), 4:(3,3,2), 3:(4,1,0), 2:(4,0,1), 1:(5,1,1), 0:(5,0,0)},
@@ -58,7 +67,16 @@ BDD_INDEP_SETS = dict(
 )
 
 
+def as_bdd(bdd):
+    """
+    wrap a bare BeadTable (or beads dict) up as a BDD dict; pass BDDs through
+    """
+    if isinstance(bdd, BeadTable) or 'dag' not in bdd:
+        return dict(s = len(bdd), dag = bdd)
+    return bdd
+
 def bdd_root(bdd):
+    bdd = as_bdd(bdd)
     # nb this implies convention that s=2 of a 1 bead BDD containing only True sink (Knuth p75)
     return bdd['s'] - 1
 
@@ -66,21 +84,58 @@ def bdd_root(bdd):
 my soln to Ex. 10
 """
 def bdd_equality(x, y):
+    x = as_bdd(x)
+    y = as_bdd(y)
     x_dag = x['dag']
     y_dag = y['dag']
 
     # do a DFS over the pair of dags checking each pair of nodes are equal
-    # (either both the same sink, or both branching on the same variable)
+    # (either both the same sink, or both branching on the same variable).
+    # each pair is only checked once, so shared sub-dags are not re-explored:
+    # for equal reduced BDDs this visits each node once. the DFS uses an
+    # explicit stack, so deep BDDs cannot overflow the python stack
 
-    def compare(x_key, y_key):
-        if x_dag[x_key][0] != y_dag[y_key][0]:
+    root_pair = (bdd_root(x), bdd_root(y))
+    checked = set([root_pair])
+    stack = [root_pair]
+    while stack:
+        x_key, y_key = stack.pop()
+        x_v, x_l, x_h = x_dag[x_key]
+        y_v, y_l, y_h = y_dag[y_key]
+        if x_v != y_v:
             return False
         elif (x_key < 2) or (y_key < 2):
-            return x_key == y_key
+            if x_key != y_key:
+                return False
         else:
-            return compare(x_dag[x_key][1], y_dag[y_key][1]) and compare(x_dag[x_key][2], y_dag[y_key][2])
+            for pair in ((x_l, y_l), (x_h, y_h)):
+                if pair not in checked:
+                    checked.add(pair)
+                    stack.append(pair)
+    return True
+
+def bdd_fingerprint(bdd):
+    """
+    return a canonical structural hash of the BDD, as a hex string.
 
-    return compare(bdd_root(x), bdd_root(y))
+    the hash of each bead combines its variable with the hashes of its
+    branches (a Merkle hash), so it depends only on the shape of the BDD and
+    not on how its keys are numbered : BDDs equal under bdd_equality have the
+    same fingerprint. reduce BDDs first to get one fingerprint per function.
+    one pass over the beads, in increasing key order
+    """
+    bdd = as_bdd(bdd)
+    s = bdd['s']
+    dag = bdd['dag']
+    h = [None] * s
+    for k in xrange(s):
+        v, l, r = dag[k]
+        if k < 2:
+            # sinks : nb k is 0 for False and 1 for True
+            h[k] = hashlib.md5(struct.pack('<ii', v, k)).digest()
+        else:
+            h[k] = hashlib.md5(struct.pack('<i', v) + h[l] + h[r]).digest()
+    return h[s - 1].encode('hex')
 
 """
 algorithm C. p75, Knuth
@@ -91,6 +146,7 @@ def bdd_count_solutions(bdd, c = None):
     it should be a map, which will then be used to tabulate the counts of the
     sub graphs for each bead in the bdd.
     """
+    bdd = as_bdd(bdd)
     s = bdd['s']
     dag = bdd['dag']
     if c is None:
@@ -112,6 +168,7 @@ def bdd_count_solutions(bdd, c = None):
     return (2 ** (v_root - 1)) * c[s - 1]
 
 def bdd_generate_random_solution(bdd, c, rand):
+    bdd = as_bdd(bdd)
     s = bdd['s']
     dag = bdd['dag']
     x = []
@@ -137,9 +194,113 @@ def bdd_generate_random_solution(bdd, c, rand):
             x.append(0)
             k = l_k
 
+"""
+ranking and unranking, guided by the count table c as above
+"""
+def bdd_solution_counts(bdd, c = None, v_first = 0):
+    """
+    return (total, c) : the number of solutions, counting variables from
+    v_first, and the table c of bdd_count_solutions. as for
+    bdd_generate_random_solution, a c that is given must be filled in already.
+
+    v_first is 0 for the BDDs of connection.py, and 1 for the hand made ones
+    here (BDD_X, BDD_INDEP_SETS, ...)
+    """
+    bdd = as_bdd(bdd)
+    if c is None:
+        c = {}
+        bdd_count_solutions(bdd, c)
+    s = bdd['s']
+    if s < 2:
+        return 0, c
+    v_root = bdd['dag'][s - 1][0]
+    if v_root < v_first:
+        raise ValueError('the root tests variable %d, before v_first %d' % (
+            v_root, v_first,
+        ))
+    return c[s - 1] * 2 ** (v_root - v_first), c
+
+def bdd_rank_solution(bdd, x, c = None, v_first = 0):
+    """
+    return the rank of solution x (a sequence of 0s and 1s for variables
+    v_first, ...) among all solutions in lexicographic order, ie the number
+    of solutions that come before it. x[0] is the most significant
+    """
+    bdd = as_bdd(bdd)
+    dag = bdd['dag']
+    _, c = bdd_solution_counts(bdd, c, v_first)
+    k = bdd['s'] - 1
+    r = 0
+    for i, bit in enumerate(x, v_first):
+        if k == 0:
+            break
+        v_k, l_k, h_k = dag[k]
+        if i < v_k:
+            # a skipped variable : every solution with a 0 here comes first
+            zeros = 2 ** (v_k - i - 1) * c[k]
+        else:
+            zeros = 2 ** (dag[l_k][0] - v_k - 1) * c[l_k]
+            k = h_k if bit else l_k
+        if bit:
+            r += zeros
+    if k == 0:
+        raise ValueError('not a solution')
+    return r
+
+def bdd_unrank_solution(bdd, r, c = None, v_first = 0):
+    """
+    return the solution of rank r in lexicographic order, as a list of 0s
+    and 1s for variables v_first, ...
+    """
+    bdd = as_bdd(bdd)
+    dag = bdd['dag']
+    total, c = bdd_solution_counts(bdd, c, v_first)
+    if not (0 <= r < total):
+        raise ValueError('rank %d out of range, there are %d solutions' % (
+            r, total,
+        ))
+    k = bdd['s'] - 1
+    n = dag[0][0]
+    x = []
+    for i in xrange(v_first, n):
+        v_k, l_k, h_k = dag[k]
+        if i < v_k:
+            zeros = 2 ** (v_k - i - 1) * c[k]
+        else:
+            zeros = 2 ** (dag[l_k][0] - v_k - 1) * c[l_k]
+        if r < zeros:
+            x.append(0)
+            if i == v_k:
+                k = l_k
+        else:
+            r -= zeros
+            x.append(1)
+            if i == v_k:
+                k = h_k
+    return x
+
+def bdd_enumerate_solutions(bdd, start = 0, stop = None, c = None,
+        v_first = 0):
+    """
+    lazily generate the solutions of ranks start, ..., stop - 1 (by default
+    to the last one) in lexicographic order. disjoint rank ranges give
+    disjoint solutions, so enumeration can be split between workers
+    """
+    bdd = as_bdd(bdd)
+    total, c = bdd_solution_counts(bdd, c, v_first)
+    if stop is None or stop > total:
+        stop = total
+    r = start
+    while r < stop:
+        yield bdd_unrank_solution(bdd, r, c, v_first)
+        r += 1
 
 def main():
     print 'are BDDs x and y equal? %s' % bdd_equality(BDD_X, BDD_Y)
+    print 'fingerprints of x and y: %s %s' % (
+        bdd_fingerprint(BDD_X),
+        bdd_fingerprint(BDD_Y),
+    )
 
     print 'how many solutions does x have? %d' % bdd_count_solutions(BDD_X)
     print 'how many solutions does y have? %d' % bdd_count_solutions(BDD_Y)
@@ -154,5 +315,9 @@ def main():
     print bdd_generate_random_solution(BDD_INDEP_SETS, c, random.random)
     print bdd_generate_random_solution(BDD_INDEP_SETS, c, random.random)
 
+    print 'indep_sets solutions of rank 5 to 9:'
+    for x in bdd_enumerate_solutions(BDD_INDEP_SETS, 5, 10, c, v_first = 1):
+        print x, bdd_rank_solution(BDD_INDEP_SETS, x, c, v_first = 1)
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,423 @@
+"""
+A BDD manager : build reduced ordered BDDs by combining other BDDs.
+
+Nodes live in a single BeadTable shared by every BDD the manager makes.
+The unique table maps (v, l, h) to the key of the node testing x_v with
+those branches, so a node is only ever created once and a BDD is just the
+key of its root. Keys 0 and 1 are the False and True sinks, as in bdd.py,
+and since children are always made before their parents every node's
+branches have smaller keys than the node itself.
+
+Variables are numbered 0, ..., n_vars - 1, the same way connection.py
+numbers edges, and the sinks test the dummy variable n_vars.
+
+The binary operations (Knuth's "melds") and ite are memoised in a computed
+table of fixed size. It is direct mapped and lossy : a new entry simply
+overwrites whatever was in its slot. So memory stays bounded, and each
+operation still runs in time proportional to the size of the product of
+its arguments as long as the table is big enough to hold that product.
+
+A typical use is to intersect the connectedness BDD from connection.py
+with some extra constraints:
+
+    manager = BDDManager(len(edge_order))
+    connected = manager.import_bdd(reduce_beads(beads))
+    # at most two edges meet at vertex 0, and edge 3 is included
+    degree = manager.cardinality([0, 1], 0, 2)
+    f = manager.and_(manager.and_(connected, degree), manager.var(3))
+    print manager.count(f)
+
+Restriction and quantification rebuild a BDD in one bottom-up pass over
+its nodes, and bdd_restrict, bdd_condition, bdd_exists and bdd_forall do
+the same for a bead table, so conditional counts and samples need no
+rebuild of the connectedness BDD:
+
+    # connected subgraphs that include edges 3 and 5 but not edge 4
+    beads = bdd_condition(reduce_beads(beads), {3 : 1, 4 : 0, 5 : 1})
+"""
+
+from bead_table import BeadTable
+from bdd import as_bdd
+
+FALSE = 0
+TRUE = 1
+
+AND = 'and'
+OR = 'or'
+XOR = 'xor'
+
+# value of each binary operation on a pair of sinks
+SINK_OPERATIONS = {
+    AND : lambda f, g : f & g,
+    OR : lambda f, g : f | g,
+    XOR : lambda f, g : f ^ g,
+}
+
+class BDDManager(object):
+    def __init__(self, n_vars, cache_size = 1 << 18):
+        """
+        n_vars is the number of variables. cache_size is the number of slots
+        in the computed table, rounded up to a power of two
+        """
+        self.n_vars = n_vars
+        self.nodes = BeadTable()
+        self.nodes.append(n_vars, FALSE, FALSE)
+        self.nodes.append(n_vars, TRUE, TRUE)
+        self.unique = {}
+        size = 1
+        while size < cache_size:
+            size *= 2
+        self.cache_mask = size - 1
+        self.cache_keys = [None] * size
+        self.cache_values = [0] * size
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def make_node(self, v, l, h):
+        """
+        return key of the node testing x_v with branches l, h, making it if
+        need be. no node is made if l == h, as it would be redundant
+        """
+        if l == h:
+            return l
+        bead = (v, l, h)
+        key = self.unique.get(bead)
+        if key is None:
+            key = self.nodes.append(v, l, h)
+            self.unique[bead] = key
+        return key
+
+    def var(self, v):
+        """
+        the function x_v
+        """
+        return self.make_node(v, FALSE, TRUE)
+
+    def nvar(self, v):
+        """
+        the function not x_v
+        """
+        return self.make_node(v, TRUE, FALSE)
+
+    def cube(self, literals):
+        """
+        the conjunction of the given literals, a dict mapping each variable
+        to the value (0 or 1) it is forced to take
+        """
+        f = TRUE
+        for v in sorted(literals, reverse = True):
+            if literals[v]:
+                f = self.make_node(v, FALSE, f)
+            else:
+                f = self.make_node(v, f, FALSE)
+        return f
+
+    def cardinality(self, variables, lo_count, hi_count):
+        """
+        the function that is true when at least lo_count and at most hi_count
+        of the given variables are 1 (eg a degree bound on a vertex, taking
+        variables to be the edges incident to it)
+        """
+        variables = sorted(variables)
+        # nodes[c] is the function of the variables from i onward given that c
+        # of the earlier ones are 1. counts beyond hi_count are all the same
+        nodes = [
+            TRUE if lo_count <= c <= hi_count else FALSE
+            for c in xrange(hi_count + 2)
+        ]
+        for i in xrange(len(variables) - 1, -1, -1):
+            v = variables[i]
+            nodes = [
+                self.make_node(v, nodes[c], nodes[min(c + 1, hi_count + 1)])
+                for c in xrange(min(i, hi_count + 1) + 1)
+            ]
+        return nodes[0]
+
+    # computed table
+
+    def cache_lookup(self, key):
+        slot = hash(key) & self.cache_mask
+        if self.cache_keys[slot] == key:
+            self.cache_hits += 1
+            return self.cache_values[slot]
+        self.cache_misses += 1
+        return None
+
+    def cache_insert(self, key, value):
+        slot = hash(key) & self.cache_mask
+        self.cache_keys[slot] = key
+        self.cache_values[slot] = value
+
+    def clear_cache(self):
+        self.cache_keys = [None] * len(self.cache_keys)
+
+    def cofactors(self, f, v):
+        """
+        return the (low, high) branches of f with respect to x_v, where v is
+        no greater than the variable f tests
+        """
+        nodes = self.nodes
+        if nodes.var[f] == v:
+            return nodes.lo[f], nodes.hi[f]
+        return f, f
+
+    # operations
+
+    def neg(self, f):
+        """
+        not f
+        """
+        if f < 2:
+            return 1 - f
+        key = ('not', f)
+        result = self.cache_lookup(key)
+        if result is not None:
+            return result
+        nodes = self.nodes
+        result = self.make_node(
+            nodes.var[f],
+            self.neg(nodes.lo[f]),
+            self.neg(nodes.hi[f]),
+        )
+        self.cache_insert(key, result)
+        return result
+
+    def apply(self, op, f, g):
+        """
+        combine f and g with the binary operation op, one of AND, OR, XOR
+        """
+        if f < 2 and g < 2:
+            return SINK_OPERATIONS[op](f, g)
+        if op == AND:
+            if f == FALSE or g == FALSE:
+                return FALSE
+            if f == TRUE or f == g:
+                return g
+            if g == TRUE:
+                return f
+        elif op == OR:
+            if f == TRUE or g == TRUE:
+                return TRUE
+            if f == FALSE or f == g:
+                return g
+            if g == FALSE:
+                return f
+        elif op == XOR:
+            if f == g:
+                return FALSE
+            if f == FALSE:
+                return g
+            if g == FALSE:
+                return f
+        else:
+            raise ValueError('unknown operation : %s' % op)
+        # all the operations are commutative
+        if f > g:
+            f, g = g, f
+        key = (op, f, g)
+        result = self.cache_lookup(key)
+        if result is not None:
+            return result
+        v = min(self.nodes.var[f], self.nodes.var[g])
+        f_l, f_h = self.cofactors(f, v)
+        g_l, g_h = self.cofactors(g, v)
+        result = self.make_node(
+            v,
+            self.apply(op, f_l, g_l),
+            self.apply(op, f_h, g_h),
+        )
+        self.cache_insert(key, result)
+        return result
+
+    def and_(self, f, g):
+        return self.apply(AND, f, g)
+
+    def or_(self, f, g):
+        return self.apply(OR, f, g)
+
+    def xor(self, f, g):
+        return self.apply(XOR, f, g)
+
+    def ite(self, f, g, h):
+        """
+        if f then g else h
+        """
+        if f == TRUE:
+            return g
+        if f == FALSE or g == h:
+            return h
+        if g == TRUE and h == FALSE:
+            return f
+        key = ('ite', f, g, h)
+        result = self.cache_lookup(key)
+        if result is not None:
+            return result
+        var = self.nodes.var
+        v = min(var[f], var[g], var[h])
+        f_l, f_h = self.cofactors(f, v)
+        g_l, g_h = self.cofactors(g, v)
+        h_l, h_h = self.cofactors(h, v)
+        result = self.make_node(
+            v,
+            self.ite(f_l, g_l, h_l),
+            self.ite(f_h, g_h, h_h),
+        )
+        self.cache_insert(key, result)
+        return result
+
+    # restriction and quantification, each a single bottom-up pass over the
+    # nodes of f
+
+    def restrict(self, f, assignment):
+        """
+        the cofactor of f with each variable in assignment (a dict mapping
+        variables to 0 or 1) fixed to its value. the result does not depend
+        on those variables at all
+        """
+        return self.rebuild(f, lambda v, l, h : h if assignment[v] else l,
+            assignment)
+
+    def condition(self, f, assignment):
+        """
+        f and the literals of assignment : the solutions of f that agree
+        with assignment, with those variables still tested
+        """
+        return self.and_(f, self.cube(assignment))
+
+    def exists(self, f, variables):
+        """
+        f with the given variables existentially quantified
+        """
+        return self.rebuild(f, lambda v, l, h : self.or_(l, h), set(variables))
+
+    def forall(self, f, variables):
+        """
+        f with the given variables universally quantified
+        """
+        return self.rebuild(f, lambda v, l, h : self.and_(l, h), set(variables))
+
+    def rebuild(self, f, combine, variables):
+        """
+        rebuild f from the bottom up, replacing each node testing one of the
+        given variables by combine(v, l, h) of its rebuilt branches
+        """
+        nodes = self.nodes
+        r = {FALSE : FALSE, TRUE : TRUE}
+        # nb keys are monotone, so reachable lists children before parents
+        for k in self.reachable(f):
+            if k < 2:
+                continue
+            v, l, h = nodes.var[k], r[nodes.lo[k]], r[nodes.hi[k]]
+            if v in variables:
+                r[k] = combine(v, l, h)
+            else:
+                r[k] = self.make_node(v, l, h)
+        return r[f]
+
+    # moving BDDs in and out of the manager
+
+    def import_bdd(self, bdd):
+        """
+        add the BDD (a BDD dict, beads dict or BeadTable with monotone keys,
+        eg the output of reduce_beads) to the manager, returning its root.
+        variables of the BDD are taken to be the manager's variables
+        """
+        if isinstance(bdd, dict) and 'dag' in bdd:
+            s, dag = bdd['s'], bdd['dag']
+        else:
+            s, dag = len(bdd), bdd
+        r = {}
+        for k in xrange(s):
+            v, l, h = dag[k]
+            if l == k and h == k:
+                r[k] = k
+            elif v >= self.n_vars:
+                raise ValueError(
+                    'bead %d tests x_%d but there are only %d variables' % (
+                        k, v, self.n_vars
+                    )
+                )
+            else:
+                r[k] = self.make_node(v, r[l], r[h])
+        return r[s - 1]
+
+    def reachable(self, f):
+        """
+        sorted keys of the nodes reachable from f, sinks included
+        """
+        lo, hi = self.nodes.lo, self.nodes.hi
+        seen = set([FALSE, TRUE, f])
+        stack = [f]
+        while stack:
+            k = stack.pop()
+            if k < 2:
+                continue
+            for child in (lo[k], hi[k]):
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        return sorted(seen)
+
+    def export(self, f):
+        """
+        return the BDD rooted at f as a BeadTable with monotone keys, in the
+        same form as the output of reduce_beads
+        """
+        keys = self.reachable(f)
+        if f == FALSE:
+            keys = [FALSE]
+        r = dict((k, i) for (i, k) in enumerate(keys))
+        table = BeadTable.zeros(len(keys))
+        nodes = self.nodes
+        for k in keys:
+            table.set(r[k], nodes.var[k], r[nodes.lo[k]], r[nodes.hi[k]])
+        return table
+
+    def count(self, f):
+        """
+        number of assignments to the n_vars variables for which f is true
+        """
+        var, lo, hi = self.nodes.var, self.nodes.lo, self.nodes.hi
+        c = {FALSE : 0, TRUE : 1}
+        for k in self.reachable(f):
+            if k < 2:
+                continue
+            v_k, l, h = var[k], lo[k], hi[k]
+            c[k] = (c[l] << (var[l] - v_k - 1)) + (c[h] << (var[h] - v_k - 1))
+        return c[f] << var[f]
+
+def manage(bdd):
+    """
+    return (manager, root) with the BDD imported into a new manager
+    """
+    bdd = as_bdd(bdd)
+    manager = BDDManager(bdd['dag'][0][0])
+    return manager, manager.import_bdd(bdd)
+
+def bdd_restrict(bdd, assignment):
+    """
+    the cofactor of the BDD (see BDDManager.restrict), as a BeadTable. nb
+    the fixed variables become free, so each doubles the solution count
+    """
+    manager, f = manage(bdd)
+    return manager.export(manager.restrict(f, assignment))
+
+def bdd_condition(bdd, assignment):
+    """
+    the solutions of the BDD agreeing with assignment, as a BeadTable : eg
+    the connected subgraphs including some edges and excluding others. its
+    count and samples are the conditional count and samples
+    """
+    manager, f = manage(bdd)
+    return manager.export(manager.condition(f, assignment))
+
+def bdd_exists(bdd, variables):
+    manager, f = manage(bdd)
+    return manager.export(manager.exists(f, variables))
+
+def bdd_forall(bdd, variables):
+    manager, f = manage(bdd)
+    return manager.export(manager.forall(f, variables))
@@ -0,0 +1,324 @@
+"""
+Vectorized BDD algorithms, working a whole variable layer at a time.
+
+The algorithms in bdd.py visit one bead at a time in python. Here the BDD
+is held as three numpy arrays var, lo, hi (see bead_table.BeadTable) and
+the beads are grouped into layers by the variable they test. Since every
+branch leads to a layer further down, a bottom-up pass can handle each
+layer with a handful of array operations.
+
+As in connection.py, variables are numbered from v_first = 0 and the sinks
+test the dummy variable n; the hand-written BDDs in bdd.py number their
+variables from 1, so pass v_first = 1 for those. Key 0 is the False sink
+and key 1 the True sink.
+"""
+
+import numpy
+
+from bead_table import BeadTable
+from bdd import as_bdd
+
+EXACT = 'exact'
+LOG = 'log'
+MOD = 'mod'
+
+def bdd_arrays(bdd):
+    """
+    return (var, lo, hi) of the BDD as numpy arrays indexed by key
+    """
+    dag = as_bdd(bdd)['dag']
+    if not isinstance(dag, BeadTable):
+        dag = BeadTable.from_dict(dag)
+    return dag.as_numpy()
+
+def bdd_layers(var):
+    """
+    group the non-sink beads by variable, returning a list of (v, keys) pairs
+    ordered from the bottom layer up. keys within a layer are increasing
+    """
+    order = numpy.argsort(var[2:], kind = 'mergesort') + 2
+    variables, starts = numpy.unique(var[order], return_index = True)
+    ends = list(starts[1:]) + [len(order)]
+    return [
+        (int(v), order[start:end])
+        for (v, start, end) in reversed(zip(variables, starts, ends))
+    ]
+
+"""
+algorithm C, a layer at a time
+"""
+def bdd_count_layered(bdd, mode = EXACT, modulus = None, v_first = 0):
+    """
+    count the solutions of the BDD, returning (count, c) where c is an array
+    tabulating the count for the sub-BDD rooted at each bead, as in
+    bdd.bdd_count_solutions. mode is one of
+
+        EXACT : exact python integers, in an object array
+        LOG : natural logarithms of the counts, as floats. -inf for zero
+        MOD : counts modulo the given prime modulus, which must be < 2 ** 31
+    """
+    var, lo, hi = bdd_arrays(bdd)
+    s = len(var)
+    n = int(var[0])
+    if mode == EXACT:
+        c = numpy.zeros(s, dtype = object)
+        c[:] = 0
+        pow2 = numpy.array([1 << k for k in xrange(n + 1)], dtype = object)
+        combine = lambda c_l, k_l, c_h, k_h : c_l * pow2[k_l] + c_h * pow2[k_h]
+        one = 1
+    elif mode == LOG:
+        c = numpy.empty(s, dtype = numpy.float64)
+        c[:] = -numpy.inf
+        log2 = numpy.log(2.0)
+        combine = lambda c_l, k_l, c_h, k_h : numpy.logaddexp(
+            c_l + k_l * log2,
+            c_h + k_h * log2,
+        )
+        one = 0.0
+    elif mode == MOD:
+        if modulus is None or not (1 < modulus < (1 << 31)):
+            raise ValueError('MOD mode needs a modulus between 2 and 2 ** 31')
+        c = numpy.zeros(s, dtype = numpy.int64)
+        pow2 = numpy.array(
+            [pow(2, k, modulus) for k in xrange(n + 1)],
+            dtype = numpy.int64,
+        )
+        combine = lambda c_l, k_l, c_h, k_h : (
+            (c_l * pow2[k_l]) % modulus + (c_h * pow2[k_h]) % modulus
+        ) % modulus
+        one = 1 % modulus
+    else:
+        raise ValueError('unknown mode : %s' % mode)
+
+    if s > 1:
+        c[1] = one
+    for v, keys in bdd_layers(var):
+        l = lo[keys]
+        h = hi[keys]
+        # nb skipped variables double the count, as in bdd_count_solutions
+        c[keys] = combine(c[l], var[l] - v - 1, c[h], var[h] - v - 1)
+
+    root = s - 1
+    skipped = int(var[root]) - v_first
+    if mode == EXACT:
+        count = c[root] << skipped
+    elif mode == LOG:
+        count = c[root] + skipped * log2
+    else:
+        count = (int(c[root]) * pow(2, skipped, modulus)) % modulus
+    return count, c
+
+def bdd_branch_probabilities(bdd, v_first = 0):
+    """
+    return an array giving, for each bead, the probability that a uniformly
+    random solution passing through it takes the high branch
+    """
+    var, lo, hi = bdd_arrays(bdd)
+    _, c = bdd_count_layered(bdd, LOG, v_first = v_first)
+    p_high = numpy.zeros(len(var))
+    keys = numpy.arange(2, len(var))
+    h = hi[keys]
+    with numpy.errstate(invalid = 'ignore'):
+        p_high[keys] = numpy.exp(
+            c[h] + (var[h] - var[keys] - 1) * numpy.log(2.0) - c[keys]
+        )
+    # beads with no solutions below them are never visited
+    p_high[numpy.isnan(p_high)] = 0.0
+    return p_high
+
+def bdd_sample_solutions(bdd, n_samples, rng, v_first = 0, packed = False,
+        p_high = None):
+    """
+    draw n_samples independent uniformly random solutions of the BDD,
+    returning them as the rows of an (n_samples, n_vars) boolean matrix, or
+    with each row packed into bytes by numpy.packbits if packed is set.
+
+    rng is a numpy random Generator (or RandomState), so runs can be
+    reproduced by seeding it. all the samples advance together one variable
+    at a time, using p_high from bdd_branch_probabilities (computed if not
+    given), so there is one vectorized step per variable rather than a python
+    loop per sample.
+    """
+    var, lo, hi = bdd_arrays(bdd)
+    n_vars = int(var[0]) - v_first
+    if len(var) < 2 or bdd_count_layered(bdd, LOG, v_first = v_first)[0] == -numpy.inf:
+        raise ValueError('there are no solutions')
+    if p_high is None:
+        p_high = bdd_branch_probabilities(bdd, v_first = v_first)
+    uniform = getattr(rng, 'random', None) or rng.random_sample
+
+    x = numpy.empty((n_samples, n_vars), dtype = numpy.bool_)
+    k = numpy.empty(n_samples, dtype = lo.dtype)
+    k[:] = len(var) - 1
+    for i in xrange(n_vars):
+        testing = var[k] == i + v_first
+        # if we skip over testing variables, they do not matter, so set the
+        # bits randomly
+        bit = uniform(n_samples) < numpy.where(testing, p_high[k], 0.5)
+        x[:, i] = bit
+        k = numpy.where(testing, numpy.where(bit, hi[k], lo[k]), k)
+    if packed:
+        return numpy.packbits(x, axis = 1)
+    return x
+
+def bdd_reliability(bdd, p, v_first = 0, max_bytes = 1 << 28):
+    """
+    probability that the BDD is satisfied when each variable is 1
+    independently with probability p[v], eg that the graph stays connected
+    when each edge survives with probability p[e]. p is a (batch, n_vars)
+    matrix of scenarios, and the result is the array of their batch
+    reliabilities; a single vector p gives a single probability.
+
+    one bottom-up pass computes every scenario at once, each layer updating
+    a (layer size, batch) block. a variable skipped by a branch is 0 or 1
+    with total probability 1, so unlike counting there are no corrections.
+    the batch is split into chunks so the table of probabilities for each
+    bead takes at most about max_bytes
+    """
+    var, lo, hi = bdd_arrays(bdd)
+    s = len(var)
+    n_vars = int(var[0]) - v_first
+    p = numpy.asarray(p, dtype = numpy.float64)
+    single = p.ndim == 1
+    p = numpy.atleast_2d(p)
+    if p.shape[1] != n_vars:
+        raise ValueError('expected %d probabilities per scenario, got %d' % (
+            n_vars, p.shape[1],
+        ))
+    batch = p.shape[0]
+    reliability = numpy.zeros(batch)
+    if s < 2:
+        return reliability[0] if single else reliability
+
+    layers = bdd_layers(var)
+    chunk = max(1, max_bytes // (8 * s))
+    for start in xrange(0, batch, chunk):
+        q = p[start:start + chunk]
+        r = numpy.zeros((s, len(q)))
+        r[1] = 1.0
+        for v, keys in layers:
+            p_v = q[:, v - v_first]
+            r[keys] = r[lo[keys]] + p_v * (r[hi[keys]] - r[lo[keys]])
+        reliability[start:start + chunk] = r[s - 1]
+    return reliability[0] if single else reliability
+
+"""
+algorithm C with a generating function, a layer at a time
+"""
+def bdd_count_by_size(bdd, mode = EXACT, modulus = None, v_first = 0):
+    """
+    count the solutions of the BDD by how many variables they set to 1, eg
+    the connected subgraphs by their number of edges. returns (poly, c)
+    where poly[k] is the number of solutions with k ones, and c[key] is the
+    same polynomial for the sub-BDD rooted at each bead, as an (s, n + 1)
+    array. mode and modulus are as for bdd_count_layered
+    """
+    var, lo, hi = bdd_arrays(bdd)
+    s = len(var)
+    n = int(var[0])
+    if mode == EXACT:
+        c = numpy.zeros((s, n + 1), dtype = object)
+        c[:] = 0
+        add = lambda a, b : a + b
+        zero, one = 0, 1
+    elif mode == LOG:
+        c = numpy.empty((s, n + 1), dtype = numpy.float64)
+        c[:] = -numpy.inf
+        add = numpy.logaddexp
+        zero, one = -numpy.inf, 0.0
+    elif mode == MOD:
+        if modulus is None or not (1 < modulus < (1 << 31)):
+            raise ValueError('MOD mode needs a modulus between 2 and 2 ** 31')
+        c = numpy.zeros((s, n + 1), dtype = numpy.int64)
+        add = lambda a, b : (a + b) % modulus
+        zero, one = 0, 1 % modulus
+    else:
+        raise ValueError('unknown mode : %s' % mode)
+
+    def times_x(a):
+        shifted = numpy.empty_like(a)
+        shifted[..., 0] = zero
+        shifted[..., 1:] = a[..., :-1]
+        return shifted
+
+    def pad(a, skipped):
+        # nb each skipped variable may be 0 or 1, multiplying by (1 + x)
+        a = a.copy()
+        for j in xrange(int(skipped.max()) if len(skipped) else 0):
+            rows = skipped > j
+            a[rows] = add(a[rows], times_x(a[rows]))
+        return a
+
+    if s > 1:
+        c[1, 0] = one
+    for v, keys in bdd_layers(var):
+        l = lo[keys]
+        h = hi[keys]
+        c[keys] = add(
+            pad(c[l], var[l] - v - 1),
+            times_x(pad(c[h], var[h] - v - 1)),
+        )
+
+    root = s - 1
+    skipped = numpy.array([int(var[root]) - v_first])
+    poly = pad(c[root:root + 1], skipped)[0]
+    return poly[:n + 1 - v_first], c
+
+"""
+algorithm B, Knuth
+"""
+def bdd_max_weight_solution(bdd, weights, v_first = 0):
+    """
+    find a solution x of the BDD maximising sum(weights[v] * x[v]), returning
+    (best total, x) with x a boolean array. one bottom-up pass finds the best
+    total below each bead, remembering which branch gave it, and the witness
+    is read off by following those branches down from the root. variables
+    that are skipped are free, so are set to 1 just if their weight is
+    positive
+    """
+    var, lo, hi = bdd_arrays(bdd)
+    s = len(var)
+    n_vars = int(var[0]) - v_first
+    w = numpy.asarray(weights, dtype = numpy.float64)
+    if w.shape != (n_vars, ):
+        raise ValueError('expected %d weights, got %s' % (n_vars, w.shape))
+    if s < 2:
+        raise ValueError('there are no solutions')
+    positive = numpy.maximum(w, 0.0)
+    # free[j] is the best total of variables v_first, ..., j - 1 left free
+    free = numpy.concatenate([[0.0], numpy.cumsum(positive)])
+
+    # best[key] is the best total of the variables tested below key, and any
+    # skipped on the way, ie of var[key] onwards
+    best = numpy.empty(s)
+    best[0] = -numpy.inf
+    best[1] = 0.0
+    take_high = numpy.zeros(s, dtype = numpy.bool_)
+    for v, keys in bdd_layers(var):
+        i = v - v_first
+        l = lo[keys]
+        h = hi[keys]
+        low_total = best[l] + free[var[l] - v_first] - free[i + 1]
+        high_total = w[i] + best[h] + free[var[h] - v_first] - free[i + 1]
+        take_high[keys] = high_total > low_total
+        best[keys] = numpy.maximum(low_total, high_total)
+
+    root = s - 1
+    total = best[root] + free[var[root] - v_first]
+    if total == -numpy.inf:
+        raise ValueError('there are no solutions')
+    x = positive > 0
+    k = root
+    while k > 1:
+        x[var[k] - v_first] = take_high[k]
+        k = hi[k] if take_high[k] else lo[k]
+    return total, x
+
+def bdd_min_weight_solution(bdd, weights, v_first = 0):
+    """
+    as bdd_max_weight_solution, minimising instead
+    """
+    total, x = bdd_max_weight_solution(
+        bdd, -numpy.asarray(weights, dtype = numpy.float64), v_first,
+    )
+    return -total, x
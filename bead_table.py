@@ -0,0 +1,285 @@
+"""
+Compact, array-backed storage for the beads of a BDD.
+
+The dict format used everywhere else maps each key k to a tuple
+(k_v, k_l, k_h). That is convenient but costs well over a hundred
+bytes per bead once tuple, int and dict overheads are counted.
+
+A BeadTable stores the same beads in three parallel integer arrays,
+var, lo and hi, indexed by key. Keys must therefore run 0, ..., s - 1,
+which is exactly what make_connectedness_tree and rekey_monotone
+produce, so the keys themselves need no storage at all. With 32 bit
+entries a bead costs 12 bytes.
+
+A BeadTable behaves like a read-only dict of beads (len, [], in,
+iteritems, ...), so it can be handed to any function that expects the
+dict format.
+
+Tables can be saved to a compact binary file and loaded back, optionally
+memory-mapped so that even huge tables open instantly.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+
+# signed 32 bit entries : plenty for any BDD that fits in memory
+TYPECODE = 'i'
+
+class BeadTable(object):
+    def __init__(self, var = None, lo = None, hi = None):
+        """
+        wrap three equal-length integer sequences var, lo, hi. these are
+        usually array.array instances but anything indexable works, eg numpy
+        arrays. if none are given an empty, appendable table is made.
+        """
+        if var is None and lo is None and hi is None:
+            var, lo, hi = array(TYPECODE), array(TYPECODE), array(TYPECODE)
+        if not (len(var) == len(lo) == len(hi)):
+            raise ValueError('var, lo and hi must have the same length')
+        self.var = var
+        self.lo = lo
+        self.hi = hi
+
+    @classmethod
+    def zeros(cls, s):
+        """
+        make a table of s beads, all (0, 0, 0), to be filled in by key
+        """
+        zero = array(TYPECODE, [0])
+        return cls(zero * s, zero * s, zero * s)
+
+    @classmethod
+    def from_dict(cls, beads):
+        """
+        convert beads in the dict format {k : (k_v, k_l, k_h)}
+        keys must be exactly 0, ..., len(beads) - 1
+        """
+        if isinstance(beads, BeadTable):
+            return beads
+        s = len(beads)
+        table = cls.zeros(s)
+        for key, (v, l, h) in beads.iteritems():
+            if not (0 <= key < s):
+                raise ValueError(
+                    'bead keys must be 0, ..., %d; got %s' % (s - 1, key)
+                )
+            table.set(key, v, l, h)
+        return table
+
+    def to_dict(self):
+        """
+        convert back to the dict format {k : (k_v, k_l, k_h)}
+        """
+        return dict(self.iteritems())
+
+    def set(self, key, v, l, h):
+        self.var[key] = v
+        self.lo[key] = l
+        self.hi[key] = h
+
+    def append(self, v, l, h):
+        """
+        add a bead with key len(self), returning the key
+        """
+        key = len(self.var)
+        self.var.append(v)
+        self.lo.append(l)
+        self.hi.append(h)
+        return key
+
+    def nbytes(self):
+        """
+        number of bytes used by the three arrays
+        """
+        return sum(
+            len(a) * a.itemsize for a in (self.var, self.lo, self.hi)
+        )
+
+    def as_numpy(self):
+        """
+        return (var, lo, hi) as numpy arrays. for array.array storage these
+        are zero-copy views, so writes through them show up in the table
+        """
+        import numpy
+        return tuple(
+            a if isinstance(a, numpy.ndarray) else
+            numpy.frombuffer(a, dtype = numpy.dtype(a.typecode))
+            for a in (self.var, self.lo, self.hi)
+        )
+
+    # read-only dict interface, so a BeadTable can stand in for beads
+
+    def __len__(self):
+        return len(self.var)
+
+    def __getitem__(self, key):
+        if not (0 <= key < len(self.var)):
+            raise KeyError(key)
+        return (int(self.var[key]), int(self.lo[key]), int(self.hi[key]))
+
+    def __contains__(self, key):
+        return 0 <= key < len(self.var)
+
+    def __iter__(self):
+        return iter(xrange(len(self.var)))
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return range(len(self.var))
+
+    def get(self, key, default = None):
+        if key in self:
+            return self[key]
+        return default
+
+    def iteritems(self):
+        var, lo, hi = self.var, self.lo, self.hi
+        for key in xrange(len(var)):
+            yield key, (int(var[key]), int(lo[key]), int(hi[key]))
+
+    def items(self):
+        return list(self.iteritems())
+
+    def itervalues(self):
+        for _, bead in self.iteritems():
+            yield bead
+
+    def values(self):
+        return list(self.itervalues())
+
+    def __eq__(self, other):
+        if isinstance(other, BeadTable):
+            other = other.iteritems()
+        elif isinstance(other, dict):
+            if len(other) != len(self):
+                return False
+            return all(other.get(k) == bead for k, bead in self.iteritems())
+        else:
+            return NotImplemented
+        return list(self.iteritems()) == list(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return 'BeadTable(<%d beads>)' % len(self)
+
+# binary file format, all little endian:
+#
+#   header, HEADER_SIZE bytes :
+#       magic 'BEADTBL\0', format version, bytes per entry,
+#       s (number of beads), n (the sink variable), root, false sink, true sink
+#       zero padding
+#   var : s entries
+#   lo : s entries
+#   hi : s entries
+#
+# the arrays start at fixed, aligned offsets so the loader can map them
+# straight out of the file without copying
+
+MAGIC = 'BEADTBL\0'
+FORMAT_VERSION = 1
+HEADER_FORMAT = '<8sIIqqqqq'
+HEADER_SIZE = 64
+
+def write_header(out_file, s, n):
+    """
+    write the header for a table of s beads whose sinks test variable n. the
+    arrays must follow, each of s entries
+    """
+    if s:
+        root, false_sink, true_sink = s - 1, 0, min(1, s - 1)
+    else:
+        n, root, false_sink, true_sink = 0, -1, -1, -1
+    header = struct.pack(
+        HEADER_FORMAT, MAGIC, FORMAT_VERSION, array(TYPECODE).itemsize,
+        s, n, root, false_sink, true_sink,
+    )
+    out_file.write(header.ljust(HEADER_SIZE, '\0'))
+
+def save_bead_table(beads, file_name):
+    """
+    write beads (a BeadTable, or dict with keys 0, ..., s - 1) to file
+    """
+    table = BeadTable.from_dict(beads)
+    s = len(table)
+    itemsize = array(TYPECODE).itemsize
+    out_file = open(file_name, 'wb')
+    try:
+        write_header(out_file, s, table.var[0] if s else 0)
+        for a in (table.var, table.lo, table.hi):
+            if not isinstance(a, array):
+                # eg numpy arrays, from a memory-mapped table
+                import numpy
+                numpy.asarray(a, dtype = '<i%d' % itemsize).tofile(out_file)
+                continue
+            if a.typecode != TYPECODE or sys.byteorder != 'little':
+                a = array(TYPECODE, a)
+                if sys.byteorder != 'little':
+                    a.byteswap()
+            a.tofile(out_file)
+    finally:
+        out_file.close()
+
+def read_header(in_file):
+    """
+    read and check the header of a bead table file, returning a dict of its
+    fields
+    """
+    header = in_file.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or not header.startswith(MAGIC):
+        raise ValueError('not a bead table file')
+    fields = struct.unpack_from(HEADER_FORMAT, header)
+    (_, version, itemsize, s, n, root, false_sink, true_sink) = fields
+    if version != FORMAT_VERSION:
+        raise ValueError('unsupported bead table format version %d' % version)
+    if itemsize != array(TYPECODE).itemsize:
+        raise ValueError('unsupported bead table entry size %d' % itemsize)
+    return dict(
+        s = s,
+        n = n,
+        root = root,
+        false_sink = false_sink,
+        true_sink = true_sink,
+        itemsize = itemsize,
+    )
+
+def load_bead_table(file_name, use_mmap = True):
+    """
+    load a BeadTable written by save_bead_table.
+
+    with use_mmap the file is memory-mapped read-only and the table wraps
+    numpy views of the mapping, so nothing is copied : opening is instant
+    whatever the size, pages are only read as they are touched, and
+    processes loading the same file share the same physical pages. otherwise
+    the arrays are read into memory.
+    """
+    in_file = open(file_name, 'rb')
+    try:
+        header = read_header(in_file)
+        s, itemsize = header['s'], header['itemsize']
+        offsets = [HEADER_SIZE + i * s * itemsize for i in xrange(3)]
+        if use_mmap and s:
+            import numpy
+            mapping = mmap.mmap(in_file.fileno(), 0, access = mmap.ACCESS_READ)
+            dtype = numpy.dtype('<i%d' % itemsize)
+            return BeadTable(*[
+                numpy.frombuffer(mapping, dtype = dtype, count = s, offset = offset)
+                for offset in offsets
+            ])
+        arrays = []
+        for _ in xrange(3):
+            a = array(TYPECODE)
+            a.fromfile(in_file, s)
+            if sys.byteorder != 'little':
+                a.byteswap()
+            arrays.append(a)
+        return BeadTable(*arrays)
+    finally:
+        in_file.close()
@@ -0,0 +1,248 @@
+"""
+Benchmarks for the whole pipeline, over a fixed corpus of graphs.
+
+Each case runs the stages
+
+    order : order_vertices, order_edges and make_frontiers
+    build : make_connectedness_tree
+    reduce : reduce_beads
+    count : bdd_count_layered, exactly
+    sample : bdd_sample_solutions, N_SAMPLES solutions from a fixed seed
+
+each in a fresh worker process of its own, recording the best wall time (of
+a few runs) of each stage, how far the stage raised the peak resident
+memory of its worker and the number of beads it leaves (unreduced after
+build, reduced after reduce). A stage's input is handed to its worker
+before the stage starts (beads through a bead table file, read straight
+into arrays), so the memory is the stage's own, not that of making the
+graph or of earlier stages. The corpus is n by n grids,
+shells from example_shell and coarsened bitmaps from example_grid_coarsen,
+all fixed, so results can be compared across commits:
+
+    python bench.py --save before.json
+    ... hack hack hack ...
+    python bench.py --compare before.json --tolerance 0.25
+
+With --compare the exit status is 1 if any stage of any case is slower than
+the saved one by more than the tolerance, or gives a different count or
+number of beads.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+
+from connection import order_vertices, order_edges, make_frontiers, \
+    make_connectedness_tree, reduce_beads
+from bdd_vector import bdd_count_layered, bdd_sample_solutions
+from bead_table import save_bead_table, load_bead_table
+from instrument import peak_rss
+from example_grid_coarsen import make_grid_graph, make_bmp_graph, \
+    make_bmp, coarsen_bmp
+from example_shell import make_shell_graph
+
+STAGES = ('order', 'build', 'reduce', 'count', 'sample')
+N_SAMPLES = 1000
+SEED = 1
+# stages quicker than this are too noisy to call regressions
+MIN_SECONDS = 0.05
+
+def make_coarse_graph(n, coarse_factor):
+    """
+    the graph of a coarsened bitmap of a random connected subgraph of the
+    n by n grid, drawn with a fixed seed
+    """
+    vertices, edges = make_grid_graph(n)
+    vertex_order = order_vertices(vertices, edges, (0, 0))
+    edge_order = order_edges(vertices, edges, vertex_order)
+    frontiers = make_frontiers(vertex_order, edge_order)
+    beads = reduce_beads(
+        make_connectedness_tree(vertex_order, edge_order, frontiers),
+        verbose = False,
+    )
+    (soln, ) = bdd_sample_solutions(
+        beads, 1, rng = numpy.random.RandomState(SEED),
+    )
+    bmp = make_bmp(n, edge_order, vertex_order, soln)
+    return make_bmp_graph(coarsen_bmp(bmp, coarse_factor))
+
+# name : function making (vertices, edges)
+CORPUS = [
+    ('grid_%d' % n, lambda n = n : make_grid_graph(n)) for n in (4, 6, 8)
+] + [
+    ('shell_%d_%d' % (n, m), lambda n = n, m = m : make_shell_graph(n, m))
+    for (n, m) in ((7, 2), (9, 3))
+] + [
+    ('coarse_%d_%d' % (n, k), lambda n = n, k = k : make_coarse_graph(n, k))
+    for (n, k) in ((2, 2), (3, 2))
+]
+
+def run_stage(stage_name, args, work_dir):
+    """
+    run one stage in this (fresh) process, returning its result dict and
+    output. beads go in and out through the file 'beads' in work_dir
+    """
+    beads_file = os.path.join(work_dir, 'beads')
+    if stage_name in ('reduce', 'count', 'sample'):
+        beads = load_bead_table(beads_file, use_mmap = False)
+    # nb the peak so far is the input, which is live for the whole stage
+    before = peak_rss()
+    start = time.time()
+    if stage_name == 'order':
+        vertices, edges = args
+        vertex_order = order_vertices(vertices, edges, root = min(vertices))
+        edge_order = order_edges(vertices, edges, vertex_order)
+        output = vertex_order, edge_order, make_frontiers(vertex_order, edge_order)
+    elif stage_name == 'build':
+        output = make_connectedness_tree(*args, bead_table = True)
+    elif stage_name == 'reduce':
+        output = reduce_beads(beads, verbose = False)
+    elif stage_name == 'count':
+        output, _ = bdd_count_layered(beads)
+    elif stage_name == 'sample':
+        bdd_sample_solutions(
+            beads, N_SAMPLES, rng = numpy.random.RandomState(SEED),
+        )
+        output = None
+    result = dict(seconds = time.time() - start)
+    after = peak_rss()
+    result['rss_growth'] = None if before is None else after - before
+    if stage_name in ('build', 'reduce'):
+        result['beads'] = len(output)
+        save_bead_table(output, beads_file)
+        output = None
+    elif stage_name == 'count':
+        result['count'] = str(output)
+        output = None
+    return result, output
+
+def run_case(name, pool):
+    """
+    run the pipeline on the named graph, a stage per worker of pool,
+    returning a dict of stage results
+    """
+    make_graph = dict(CORPUS)[name]
+    graph = make_graph()
+    work_dir = tempfile.mkdtemp()
+    try:
+        results = {}
+        args = graph
+        for stage_name in STAGES:
+            results[stage_name], output = pool.apply(
+                run_stage, (stage_name, args, work_dir),
+            )
+            if stage_name == 'order':
+                args = output
+    finally:
+        shutil.rmtree(work_dir)
+    return results
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_corpus(names, repeat = 3, verbose = True):
+    """
+    run each case repeat times, keeping the best time for each stage
+    """
+    # each stage gets a fresh process, so peak memory is its own
+    pool = multiprocessing.Pool(1, maxtasksperchild = 1)
+    try:
+        cases = {}
+        for name in names:
+            runs = [run_case(name, pool) for _ in xrange(repeat)]
+            cases[name] = runs[0]
+            for stage_name in STAGES:
+                cases[name][stage_name]['seconds'] = min(
+                    run[stage_name]['seconds'] for run in runs
+                )
+            if verbose:
+                print_case(name, cases[name])
+    finally:
+        pool.close()
+        pool.join()
+    return dict(
+        commit = git_commit(),
+        python = platform.python_version(),
+        machine = platform.machine(),
+        cases = cases,
+    )
+
+def print_case(name, results):
+    for stage_name in STAGES:
+        r = results[stage_name]
+        print '%-12s %-7s %9.3fs %8.1f MiB %10s' % (
+            name,
+            stage_name,
+            r['seconds'],
+            (r['rss_growth'] or 0) / float(1 << 20),
+            r.get('beads', ''),
+        )
+
+def compare(baseline, current, tolerance):
+    """
+    return a list of regressions of current against baseline
+    """
+    problems = []
+    for name, results in sorted(current['cases'].iteritems()):
+        if name not in baseline['cases']:
+            continue
+        before = baseline['cases'][name]
+        for stage_name in STAGES:
+            old = before[stage_name]
+            new = results[stage_name]
+            for key in ('count', 'beads'):
+                if old.get(key) != new.get(key):
+                    problems.append('%s %s : %s %s, was %s' % (
+                        name, stage_name, key, new.get(key), old.get(key),
+                    ))
+            limit = max(old['seconds'], MIN_SECONDS) * (1 + tolerance)
+            if new['seconds'] > limit:
+                problems.append('%s %s : %.3fs, was %.3fs (+%.0f%%)' % (
+                    name, stage_name, new['seconds'], old['seconds'],
+                    100 * (new['seconds'] / max(old['seconds'], MIN_SECONDS) - 1),
+                ))
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[1])
+    parser.add_argument('--cases', nargs = '*', default = [n for (n, _) in CORPUS],
+        help = 'names of the cases to run (default all)')
+    parser.add_argument('--save', help = 'write the results to this JSON file')
+    parser.add_argument('--compare', help = 'compare against this JSON file')
+    parser.add_argument('--repeat', type = int, default = 3,
+        help = 'runs of each case, keeping the best times (default 3)')
+    parser.add_argument('--tolerance', type = float, default = 0.25,
+        help = 'allowed slowdown as a fraction (default 0.25)')
+    args = parser.parse_args()
+
+    current = run_corpus(args.cases, args.repeat)
+    if args.save:
+        with open(args.save, 'w') as out_file:
+            json.dump(current, out_file, indent = 1, sort_keys = True)
+    if args.compare:
+        with open(args.compare) as in_file:
+            baseline = json.load(in_file)
+        problems = compare(baseline, current, args.tolerance)
+        print 'compared with %s (commit %s)' % (args.compare, baseline['commit'])
+        for problem in problems:
+            print 'REGRESSION %s' % problem
+        if problems:
+            sys.exit(1)
+        print 'no regressions'
+
+if __name__ == '__main__':
+    main()
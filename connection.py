@@ -9,12 +9,24 @@ The idea is to run this and then feed the output into
 Knuth's algorithm R in order to reduce it to a good old
 friendly ordered reduced BDD.
 
-Works okay for grids up to 8 by 8, but 9 by 9 starts to
-get pretty ugly.
+The search only remembers how the vertices on the current
+frontier are connected, so its width is bounded by the
+pathwidth of the edge ordering. Grids up to 10 by 10 build
+in well under a minute. For bigger graphs, whose unreduced
+BDD does not fit in memory, see out_of_core.py.
 """
 
+import os
 import sys
+import time
+import struct
+import hashlib
 import heapq
+import multiprocessing
+from array import array
+
+from bead_table import BeadTable, TYPECODE
+from instrument import make_depth_timer
 
 # define an ordering for the vertices by BFS from some root
 def order_vertices(vertices, edges, root = None):
@@ -29,11 +41,25 @@ def order_vertices(vertices, edges, root = None):
         if vertex not in closed:
             closed.add(vertex)
             ordering.append(vertex)
-        for adj_vertex in edges[vertex]:
+        for adj_vertex in edges.get(vertex, ()):
             if adj_vertex not in closed:
                 heapq.heappush(open, (d + 1, adj_vertex))
     return ordering
 
+# for grids, whose vertices are (i, j) pairs : order them a column at a time
+def order_grid_vertices(vertices):
+    """
+    order grid vertices (i, j) column by column, the columns running along
+    the shorter side so the frontier is as narrow as possible. every column
+    after the first then decides its edges with the same frontier steps,
+    which make_connectedness_tree(memoize = True) exploits
+    """
+    n = 1 + max(i for (i, _) in vertices) - min(i for (i, _) in vertices)
+    m = 1 + max(j for (_, j) in vertices) - min(j for (_, j) in vertices)
+    if n <= m:
+        return sorted(vertices, key = lambda (i, j) : (j, i))
+    return sorted(vertices)
+
 # define an ordering for the edges based on the vertex ordering
 def order_edges(vertices, edges, vertex_ordering):
     inverse_ordering = {}
@@ -41,7 +67,7 @@ def order_edges(vertices, edges, vertex_ordering):
         inverse_ordering[v] = i
     edge_ordering = []
     for u_i, u in enumerate(vertex_ordering):
-        for v_i in sorted(inverse_ordering[v] for v in edges[u]):
+        for v_i in sorted(inverse_ordering[v] for v in edges.get(u, ())):
             if v_i <= u_i:
                 continue
             edge_ordering.append((u_i, v_i))
@@ -49,16 +75,32 @@ def order_edges(vertices, edges, vertex_ordering):
 
 # define the frontier sets based on the edge ordering
 def make_frontiers(vertex_ordering, edge_ordering):
-    n_vertices = len(vertex_ordering)
+    """
+    frontiers[i] is the set of vertices touched by one of the edges 0, ..., i
+    that are also touched by one of the edges i + 1, .... these are the only
+    vertices whose components we need to remember after deciding edge i. a
+    vertex leaves the frontier at its last edge, so only the endpoints of edge
+    i can leave frontier i
+    """
+    last_edge = {}
+    for i, (u, v) in enumerate(edge_ordering):
+        last_edge[u] = i
+        last_edge[v] = i
     frontiers = []
-    # XXX TODO this might be wrong!
-    for (u, v) in edge_ordering:
-        frontiers.append(set(range(u, v + 1)))
+    frontier = set()
+    for i, (u, v) in enumerate(edge_ordering):
+        frontier = set(frontier)
+        for w in (u, v):
+            if last_edge[w] > i:
+                frontier.add(w)
+            else:
+                frontier.discard(w)
+        frontiers.append(frontier)
     return frontiers
 
-def make_counter():
+def make_counter(start = 0):
     def gen_integers():
-        i = 0
+        i = start
         while True:
             yield i
             i += 1
@@ -67,206 +109,831 @@ def make_counter():
         return integers.next()
     return counter
 
-def make_connectedness_tree(vertex_order, edge_order, frontiers, verbose = False):
-    n_vertices = len(vertex_order)
-    n_edges = len(edge_order)
+# each state of the search is a partition of the current frontier into
+# connected components. it is stored as a vector of component labels indexed
+# by position in the (sorted) frontier, with the components numbered 1, 2, ...
+# in order of first appearance. this form is canonical (cf Knuth's "mate"
+# vectors), and it is packed one label per character into a string, which is
+# cheap to store, hash and compare. merging two components is then a single
+# str.replace
+#
+# vertices that have left the frontier are forgotten, so two states differing
+# only in retired vertices are merged. the width of each state is bounded by
+# the size of its frontier, ie by the pathwidth of the edge ordering, and not
+# by the number of vertices
 
-    # we maintain a family of partitions of the vertices V in the graph
-    # ie, a dict of lists of subsets of V, keyed by a unique index.
-    # We'll increase the index as we generate the partitions
-    # which we'll increase as we generate the partitions. this can be
-    # processed later to form the bead keys for our BDD
-    true_sink_index = -2
-    false_sink_index = -1
+TRUE_SINK_INDEX = -2
+FALSE_SINK_INDEX = -1
 
-    make_partition_index = make_counter()
+def label_chr(max_width):
+    """
+    function mapping labels 0, ..., max_width to characters
+    """
+    return chr if max_width < (1 << 8) else unichr
 
-    partitions = {make_partition_index():[set([0])]}
-    beads = {}
+def make_frontier_steps(n_vertices, edge_order, frontiers):
+    """
+    precompute the bookkeeping needed to decide each edge, returning a list of
+    steps, one per edge, each a tuple of
 
-    def make_bead(index, variable, low_index, high_index):
-        beads[index] = (variable, low_index, high_index)
+        inserts : (position, label) of endpoints entering the frontier
+        u_pos, v_pos : positions of the endpoints in the working state
+        keep : positions of the working state that stay in the frontier
+        retire : positions of the working state leaving the frontier
+        all_seen : has every vertex been touched once this edge is decided?
 
-    make_bead(true_sink_index, n_edges, true_sink_index, true_sink_index)
-    make_bead(false_sink_index, n_edges, false_sink_index, false_sink_index)
+    the working state is the previous frontier plus the endpoints of the edge,
+    in vertex order. steps are plain tuples so they are cheap to pickle
+    """
+    max_width = max([len(f) for f in frontiers] + [0]) + 2
+    to_chr = label_chr(max_width)
+    steps = []
+    prev_frontier = []
+    seen = set()
+    for edge, frontier in zip(edge_order, frontiers):
+        working = sorted(set(prev_frontier) | set(edge))
+        position = dict((w, p) for (p, w) in enumerate(working))
+        # entering vertices get fresh labels, bigger than any in prev_frontier
+        inserts = []
+        for w in working:
+            if w not in prev_frontier:
+                inserts.append((
+                    position[w],
+                    to_chr(len(prev_frontier) + 1 + len(inserts)),
+                ))
+        seen.update(edge)
+        frontier = sorted(frontier)
+        steps.append((
+            tuple(inserts),
+            position[edge[0]],
+            position[edge[1]],
+            tuple(position[w] for w in frontier),
+            tuple(position[w] for w in working if w not in frontier),
+            len(seen) == n_vertices,
+        ))
+        prev_frontier = frontier
+    return steps
 
-    def cached_partition(cache, partition, next_partitions, next_frontier_low):
+def make_expander(step, to_chr):
+    """
+    make function mapping a state to the (low, high) pair of states after
+    deciding the edge of the given step. a successor is either a packed state
+    or one of the sink indices, if it is already known to be (dis)connected
+    """
+    inserts, u_pos, v_pos, keep, retire, all_seen = step
+
+    def finish(working):
+        if all_seen and working.count(working[0]) == len(working):
+            # every vertex seen and all in one component : connected
+            return TRUE_SINK_INDEX
+        kept = [working[p] for p in keep]
+        for p in retire:
+            if working[p] not in kept:
+                # a component is closed off once all its vertices leave the
+                # frontier, as then it can never be connected to anything else
+                return FALSE_SINK_INDEX
+        r = {}
+        for label in kept:
+            if label not in r:
+                r[label] = to_chr(len(r) + 1)
+        return ''.join([r[label] for label in kept])
+
+    def expand(state):
+        for p, label in inserts:
+            state = state[:p] + label + state[p:]
+        # Low subtree: don't include the edge
+        low = finish(state)
+        # High subtree: include the edge, merging the two components
+        l_u, l_v = state[u_pos], state[v_pos]
+        if l_u != l_v:
+            state = state.replace(l_v, l_u)
+        high = finish(state)
+        return low, high
+
+    return expand
+
+def make_memoized_expander(step, to_chr, transitions):
+    """
+    as make_expander, but remembering the successors of every state. the
+    table is kept in transitions under the step itself, so it is shared by
+    every step with the same bookkeeping : eg each column of a grid whose
+    vertices are ordered by order_grid_vertices decides its edges with the
+    same steps as the column before, and replays their transitions
+    """
+    memo = transitions.get(step)
+    if memo is None:
+        memo = transitions[step] = {}
+    expand = make_expander(step, to_chr)
+    def memoized(state):
+        successors = memo.get(state)
+        if successors is None:
+            successors = memo[state] = expand(state)
+        return successors
+    return memoized
+
+def step_prefix_keys(steps, to_chr):
+    """
+    keys[d] is a hash of the first d steps, which determine the states and
+    beads at the start of depth d
+    """
+    h = hashlib.md5(to_chr.__name__)
+    keys = [h.hexdigest()]
+    for step in steps:
+        h.update(repr(step))
+        keys.append(h.hexdigest())
+    return keys
+
+# layers with fewer states than this are expanded serially, as farming them
+# out to worker processes costs more than it saves
+PARALLEL_MIN_STATES = 2048
+
+# transitions memoized by each worker process, see make_memoized_expander
+worker_transitions = {}
+
+def expand_chunk(args):
+    """
+    worker for parallel construction, first pass : expand a chunk of the
+    states of one step, starting with the state at position start in the
+    layer. the successors are numbered by position, 2 i for the low branch of
+    the state at position i and 2 i + 1 for its high branch.
+
+    returns, for each of n_shards shards (chosen by hash), the positions and
+    successors that first appear in the chunk, and for each position of the
+    chunk the position of the first appearance of its successor in the chunk
+    (or a sink index). if memoize is set the worker remembers the transitions
+    of the step, in its own worker_transitions
+    """
+    step, to_chr, states, start, n_shards, memoize = args
+    if memoize:
+        expand = make_memoized_expander(step, to_chr, worker_transitions)
+    else:
+        expand = make_expander(step, to_chr)
+    firsts = {
+        TRUE_SINK_INDEX : TRUE_SINK_INDEX,
+        FALSE_SINK_INDEX : FALSE_SINK_INDEX,
+    }
+    shard_positions = [array(TYPECODE) for _ in xrange(n_shards)]
+    shard_successors = [[] for _ in xrange(n_shards)]
+    references = array(TYPECODE)
+    position = 2 * start
+    for state in states:
+        for successor in expand(state):
+            first = firsts.get(successor)
+            if first is None:
+                first = firsts[successor] = position
+                shard = hash(successor) % n_shards
+                shard_positions[shard].append(position)
+                shard_successors[shard].append(successor)
+            references.append(first)
+            position += 1
+    return shard_positions, shard_successors, references
+
+def deduplicate_shard(args):
+    """
+    worker for parallel construction, second pass : deduplicate the successors
+    of one shard, from all the chunks of a layer, given in order of position.
+    returns the positions of the distinct successors and the successors
+    themselves, and the other positions paired with the position of the first
+    appearance of their successor, flattened into an array
+    """
+    positions, successors = args
+    firsts = {}
+    unique_positions = array(TYPECODE)
+    unique_successors = []
+    repeats = array(TYPECODE)
+    for position, successor in zip(positions, successors):
+        first = firsts.setdefault(successor, position)
+        if first == position:
+            unique_positions.append(position)
+            unique_successors.append(successor)
+        else:
+            repeats.extend((position, first))
+    return unique_positions, unique_successors, repeats
+
+def make_layer_reducer():
+    """
+    make functions (add_layer, finish) reducing the BDD a layer at a time, as
+    make_connectedness_tree builds it from the top down, so that only the
+    beads of the reduced BDD of the layers so far are kept.
+
+    add_layer(variable, indices, lows, highs) takes the beads just made for one
+    depth, whose indices follow on from those of the layer before. the beads
+    of the newest layer can already be merged if they have identical
+    branches, or dropped if both branches agree, since their branches are
+    distinct states of the next depth. once a layer has been merged its
+    parents may in turn become mergeable, so each new layer starts a
+    bottom-up pass over the layers before it, stopping as soon as a layer is
+    left unchanged.
+
+    finish() makes a last bottom-up pass over every layer, which is
+    Algorithm R, so the result is fully reduced whatever the earlier passes
+    missed. it returns (variables, lows, highs) of the surviving beads, in
+    increasing order of index, with their branches given as positions in
+    that order (or sink indices), along with the position of the root.
+
+    besides the surviving beads, the only memory kept is redirect, an entry
+    for every bead made.
+    """
+    # redirect[i] is the bead standing in for bead i : i itself if it
+    # survives, or what it was merged into, which may be a sink index
+    redirect = array(TYPECODE)
+    layers = []
+
+    def find(i):
+        # nb sinks, and the beads of the next layer, stand for themselves
+        j = i
+        while 0 <= j < len(redirect) and redirect[j] != j:
+            j = redirect[j]
+        # path compression
+        while i != j:
+            redirect[i], i = j, redirect[i]
+        return j
+
+    def merge_layer(layer):
         """
-        add partition to cache, return index, frozen_partition
+        merge beads of layer, return (merged layer, was anything merged)
         """
-        frozen_partition = tuple([
-            frozenset(subset) for subset in partition
-        ])
-        if frozen_partition in cache:
-            index = cache[frozen_partition]
-            next_partitions[index] = frozen_partition
-            return index
-        elif len(partition) == 1 and len(partition[0]) == n_vertices:
-            return true_sink_index
-        elif next_frontier_low == n_vertices or any(max(s) < next_frontier_low for s in partition):
-            return false_sink_index
-        else:
-            index = make_partition_index()
-            cache[frozen_partition] = index
-            next_partitions[index] = frozen_partition
-            return index
+        variable, indices, lows, highs = layer
+        unique = {}
+        merged = (variable, array(TYPECODE), array(TYPECODE), array(TYPECODE))
+        for i, l, h in zip(indices, lows, highs):
+            l = find(l)
+            h = find(h)
+            if l == h:
+                redirect[i] = l
+            elif (l, h) in unique:
+                redirect[i] = unique[(l, h)]
+            else:
+                unique[(l, h)] = i
+                merged[1].append(i)
+                merged[2].append(l)
+                merged[3].append(h)
+        return merged, len(merged[1]) < len(indices)
 
-    for depth, (edge, frontier) in enumerate(zip(edge_order, frontiers)):
-        if verbose:
-            print 'depth %d: beads %d, partitions %d' % (
-                depth,
-                len(beads),
-                len(partitions)
+    def add_layer(variable, indices, lows, highs):
+        assert not indices or indices[0] == len(redirect)
+        redirect.extend(indices)
+        layers.append((variable, indices, lows, highs))
+        for depth in xrange(len(layers) - 1, -1, -1):
+            layers[depth], changed = merge_layer(layers[depth])
+            if not changed and depth < len(layers) - 1:
+                break
+
+    def finish():
+        for depth in xrange(len(layers) - 1, -1, -1):
+            layers[depth], _ = merge_layer(layers[depth])
+        root = find(0) if redirect else 0
+        # every branch is resolved now, so redirect can be reused to map
+        # indices to positions
+        variables = array(TYPECODE)
+        lows = array(TYPECODE)
+        highs = array(TYPECODE)
+        while layers:
+            variable, indices, layer_lows, layer_highs = layers.pop(0)
+            for i in indices:
+                redirect[i] = len(variables)
+                variables.append(variable)
+            lows.extend(layer_lows)
+            highs.extend(layer_highs)
+        for k in xrange(len(variables)):
+            if lows[k] >= 0:
+                lows[k] = redirect[lows[k]]
+            if highs[k] >= 0:
+                highs[k] = redirect[highs[k]]
+        if root >= 0 and redirect:
+            root = redirect[root]
+        return variables, lows, highs, root
+
+    return add_layer, finish
+
+def make_connectedness_tree(vertex_order, edge_order, frontiers, verbose = False,
+        bead_table = False, reduced = False, processes = None,
+        monitor = None, memoize = False, snapshots = None, checkpoint = None,
+        checkpoint_interval = None, resume = False):
+    """
+    returns the beads of the (unreduced) BDD as a dict, or as a BeadTable if
+    bead_table is set.
+
+    if reduced is set, the BDD is reduced on the fly instead, as each layer
+    is made (see make_layer_reducer), and the result is the reduced BDD that
+    reduce_beads would give. the beads dropped along the way are never
+    kept, so memory follows the reduced BDD, plus an entry per bead made.
+
+    if processes is given, big layers are built by a pool of that many worker
+    processes (and need numpy). the states are split into chunks which are
+    expanded in parallel (see expand_chunk), then the successors are split
+    into shards by hash, each deduplicated by one worker (see
+    deduplicate_shard), as out_of_core.expand_by_hashing does on disk. the
+    successors are numbered by the position of their first appearance, so
+    states get exactly the indices they would get serially and the BDD is
+    identical to the serial one. the parent only passes the states between
+    the workers and makes the beads with numpy.
+
+    if memoize is set, the transitions of steps that occur more than once are
+    remembered and replayed, see make_memoized_expander. this pays off for
+    grids ordered by order_grid_vertices, as transfer matrix methods do.
+    with processes each worker keeps its own table.
+
+    if snapshots is given it should be a dict, shared between builds, in which
+    the states and beads at the start of each depth are remembered under a
+    hash of the steps before it (see step_prefix_keys). a build first looks
+    for the deepest depth whose steps so far match a previous build, eg of a
+    graph with a few vertices near the end of the vertex ordering changed,
+    and resumes from there, so only the changed suffix is built. snapshots
+    keep the beads of every build that made them alive, so clear the dict
+    once it is no longer needed. not used with reduced.
+
+    if checkpoint is given, it is the name of a file to which the states and
+    beads so far are saved at the start of a depth, at most every
+    checkpoint_interval seconds (by default CHECKPOINT_INTERVAL, see
+    save_checkpoint). with resume set the build carries on from that file,
+    if it exists, giving exactly the BDD an uninterrupted build would (see
+    also resume_connectedness_tree). not used with reduced.
+
+    if monitor is given it is called with a record of statistics as each
+    depth finishes, see instrument.py. it may abort the build by raising.
+
+    bead_table, processes, memoize and monitor go with any of the other
+    options. the rest split into three modes, of which a build takes at
+    most one : reduced; snapshots; or checkpoint, with
+    checkpoint_interval and resume. ValueError is raised for any other
+    combination, eg resume without a checkpoint, rather than quietly
+    ignoring an option.
+    """
+    n_vertices = len(vertex_order)
+    n_edges = len(edge_order)
+    steps = make_frontier_steps(n_vertices, edge_order, frontiers)
+    to_chr = label_chr(max([len(f) for f in frontiers] + [0]) + 2)
+
+    # we maintain the list of states at the current depth, in order of their
+    # unique index. We'll increase the index as we generate the states, so
+    # beads are made in order of increasing index. this can be processed later
+    # to form the bead keys for our BDD
+    true_sink_index = TRUE_SINK_INDEX
+    false_sink_index = FALSE_SINK_INDEX
+
+    # nothing is on the frontier before the first edge
+    states = [(0, to_chr(0)[:0])]
+    # the bead with index i is (variables[i], lows[i], highs[i])
+    variables = array(TYPECODE)
+    lows = array(TYPECODE)
+    highs = array(TYPECODE)
+    n_beads = [0]
+    resume_depth = 0
+
+    if checkpoint is None:
+        if resume:
+            raise ValueError('resume needs a checkpoint')
+        if checkpoint_interval is not None:
+            raise ValueError('checkpoint_interval needs a checkpoint')
+    if reduced and checkpoint is not None:
+        raise ValueError('checkpoints cannot be used with reduced')
+    if reduced and snapshots is not None:
+        raise ValueError('snapshots cannot be used with reduced')
+    if checkpoint is not None and snapshots is not None:
+        raise ValueError('checkpoints cannot be used with snapshots')
+
+    if checkpoint is not None:
+        if checkpoint_interval is None:
+            checkpoint_interval = CHECKPOINT_INTERVAL
+        prefix_keys = step_prefix_keys(steps, to_chr)
+        last_checkpoint = [time.time()]
+    if resume and os.path.exists(checkpoint):
+        saved = load_checkpoint(checkpoint, to_chr)
+        resume_depth = saved['depth']
+        if (resume_depth >= len(prefix_keys) or
+                prefix_keys[resume_depth] != saved['key']):
+            raise ValueError(
+                'checkpoint %s is for a different graph or ordering' % checkpoint
             )
-        if depth + 1 < n_edges:
-            next_frontier_low = edge_order[depth + 1][0]
-        else:
-            next_frontier_low = n_vertices
-        # cache partitions generated for each depth
-        # this avoids a heap of duplication
-        partition_cache = {}
-        next_partitions = {}
-        # branch on decision to include this edge
-        for index, partition in partitions.iteritems():
-            # Low subtree: don't include the edge
-            low_partition = list(partition)
-            if not any(edge[1] in subset for subset in partition):
-                # add destination vertex as a singleton
-                # subset if we haven't seen it yet
-                low_partition.append(set([edge[1]]))
-
-            low_index = cached_partition(
-                partition_cache,
-                low_partition,
-                next_partitions,
-                next_frontier_low,
+        variables, lows, highs = saved['variables'], saved['lows'], saved['highs']
+        n_beads[0] = len(variables)
+        states = [
+            (n_beads[0] + i, state) for (i, state) in enumerate(saved['states'])
+        ]
+        if verbose:
+            print 'resuming from checkpoint at depth %d of %d' % (
+                resume_depth, len(steps),
             )
+    elif snapshots is not None:
+        prefix_keys = step_prefix_keys(steps, to_chr)
+        for depth in xrange(len(steps), 0, -1):
+            if prefix_keys[depth] in snapshots:
+                resume_depth = depth
+                (old_variables, old_lows, old_highs), n, states = (
+                    snapshots[prefix_keys[depth]]
+                )
+                variables = old_variables[:n]
+                lows = old_lows[:n]
+                highs = old_highs[:n]
+                n_beads[0] = n
+                if verbose:
+                    print 'resuming at depth %d of %d' % (depth, len(steps))
+                break
+
+    make_state_index = make_counter(n_beads[0] + len(states))
+
+    if reduced:
+        add_layer, finish_layers = make_layer_reducer()
 
-            # High subtree: include the edge
-            high_partition = []
-            to_connect = [set(edge)]
-            for subset in partition:
-                if edge[0] in subset or edge[1] in subset:
-                    to_connect.append(subset)
+    def make_bead(index, variable, low_index, high_index):
+        assert index == n_beads[0]
+        n_beads[0] += 1
+        variables.append(variable)
+        lows.append(low_index)
+        highs.append(high_index)
+
+    def cached_state(cache, state, next_states):
+        """
+        add state to cache, return index
+        """
+        if state in cache:
+            return cache[state]
+        index = make_state_index()
+        cache[state] = index
+        next_states.append((index, state))
+        return index
+
+    if monitor is not None:
+        record = make_depth_timer(true_sink_index, false_sink_index)
+
+    if memoize:
+        step_counts = {}
+        for step in steps:
+            step_counts[step] = step_counts.get(step, 0) + 1
+        transitions = {}
+
+    if processes is not None and processes > 1:
+        import numpy
+        pool = multiprocessing.Pool(processes)
+    else:
+        pool = None
+
+    try:
+        for depth, step in enumerate(steps):
+            if depth < resume_depth:
+                continue
+            if snapshots is not None and depth > 0:
+                snapshots[prefix_keys[depth]] = (
+                    (variables, lows, highs), n_beads[0], states,
+                )
+            if (checkpoint is not None and depth > resume_depth and
+                    time.time() - last_checkpoint[0] >= checkpoint_interval):
+                save_checkpoint(
+                    checkpoint, depth, prefix_keys[depth],
+                    variables, lows, highs, [state for (_, state) in states],
+                )
+                last_checkpoint[0] = time.time()
+            if verbose:
+                print 'depth %d: beads %d, states %d' % (
+                    depth,
+                    n_beads[0],
+                    len(states)
+                )
+            # cache states generated for each depth
+            # this avoids a heap of duplication
+            state_cache = {
+                true_sink_index : true_sink_index,
+                false_sink_index : false_sink_index,
+            }
+            next_states = []
+            layer_start = len(lows)
+            memoize_step = memoize and step_counts[step] > 1
+            if pool is not None and len(states) >= PARALLEL_MIN_STATES:
+                assert states[0][0] == n_beads[0]
+                chunk_size = -(-len(states) // (4 * processes))
+                chunks = [
+                    (
+                        step, to_chr,
+                        [state for (_, state) in states[i:i + chunk_size]],
+                        i, processes, memoize_step,
+                    )
+                    for i in xrange(0, len(states), chunk_size)
+                ]
+                shards = [(array(TYPECODE), []) for _ in xrange(processes)]
+                references = array(TYPECODE)
+                # nb imap hands back the chunks in order, so each shard's
+                # positions are in order
+                for positions, successors, chunk_references in pool.imap(
+                        expand_chunk, chunks):
+                    for shard, shard_positions, shard_successors in zip(
+                            shards, positions, successors):
+                        shard[0].extend(shard_positions)
+                        shard[1].extend(shard_successors)
+                    references.extend(chunk_references)
+                del chunks
+
+                # map each position to the first appearance of its successor
+                # and number the first appearances in order
+                first = numpy.arange(2 * len(states))
+                is_first = numpy.zeros(2 * len(states), dtype = bool)
+                unique_positions = array(TYPECODE)
+                unique_successors = []
+                for positions, successors, repeats in pool.imap(
+                        deduplicate_shard, shards):
+                    repeats = numpy.frombuffer(repeats, dtype = TYPECODE)
+                    first[repeats[0::2]] = repeats[1::2]
+                    is_first[numpy.frombuffer(positions, dtype = TYPECODE)] = True
+                    unique_positions.extend(positions)
+                    unique_successors.extend(successors)
+                del shards
+                next_index = len(states) + n_beads[0]
+                number = numpy.cumsum(is_first) - 1 + next_index
+                references = numpy.frombuffer(references, dtype = TYPECODE)
+                branches = numpy.where(
+                    references < 0,
+                    references,
+                    number[first[numpy.maximum(references, 0)]],
+                ).astype(TYPECODE)
+                variables.extend(array(TYPECODE, [depth]) * len(states))
+                lows.fromstring(branches[0::2].tostring())
+                highs.fromstring(branches[1::2].tostring())
+                n_beads[0] += len(states)
+
+                order = numpy.argsort(
+                    numpy.frombuffer(unique_positions, dtype = TYPECODE),
+                    kind = 'mergesort',
+                )
+                next_states = [
+                    (next_index + i, unique_successors[j])
+                    for (i, j) in enumerate(order.tolist())
+                ]
+                make_state_index = make_counter(next_index + len(next_states))
+            else:
+                if memoize_step:
+                    expand = make_memoized_expander(step, to_chr, transitions)
                 else:
-                    high_partition.append(subset)
-            newly_connected = set()
-            for subset in to_connect:
-                newly_connected = newly_connected.union(subset)
-            high_partition.append(newly_connected)
-
-            high_index = cached_partition(
-                partition_cache,
-                high_partition,
-                next_partitions,
-                next_frontier_low,
-            )
+                    expand = make_expander(step, to_chr)
+                # branch on decision to include this edge
+                for index, state in states:
+                    low, high = expand(state)
+                    low_index = cached_state(state_cache, low, next_states)
+                    high_index = cached_state(state_cache, high, next_states)
+                    # create the bead for this split
+                    make_bead(index, depth, low_index, high_index)
 
-            # create the bead for this split
-            make_bead(index, depth, low_index, high_index)
+            if monitor is not None:
+                monitor(record(
+                    depth,
+                    len(states),
+                    len(next_states),
+                    lows[layer_start:],
+                    highs[layer_start:],
+                ))
 
-        partitions = next_partitions
+            if reduced:
+                add_layer(depth, array(TYPECODE, [i for (i, _) in states]), lows, highs)
+                variables = array(TYPECODE)
+                lows = array(TYPECODE)
+                highs = array(TYPECODE)
+
+            states = next_states
+    except:
+        if pool is not None:
+            # nb close would wait for the outstanding chunks
+            pool.terminate()
+            pool.join()
+        raise
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    if reduced:
+        variables, lows, highs, root_index = finish_layers()
+    else:
+        root_index = 0
+    if n_edges == 0 and n_vertices > 1:
+        # no edges to decide, and more than one vertex to connect
+        root_index = false_sink_index
 
-    """
-    # evaluate each final partition for connectedness and set sink nodes
-    for index, partition in partitions.iteritems():
-        if len(partition) == 1 and len(partition[0]) == n_vertices:
-            make_bead(index, depth + 1, true_sink_index, true_sink_index)
-        else:
-            make_bead(index, depth + 1, false_sink_index, false_sink_index)
-    """
     # post-process - need to fix up the bead indices to agree with the usual
     # BDD indexing convention of root being highest, ..., 1 and 0 being the
     # true and false sinks
-    s = len(beads)
-    r = {
-        -2 : 1,
-        -1 : 0,
-    }
-    for i in xrange(s - 2):
-        r[i] = s - 1 - i
-    relabled_beads = {}
-    def relabel(i):
-        v, l, h = beads[i]
-        relabled_beads[r[i]] = (v, r[l], r[h])
-        del beads[i]
-    relabel(-2)
-    relabel(-1)
-    for i in xrange(s - 2):
-        relabel(i)
+    s = len(variables) + 2
+    def r(i):
+        if i == true_sink_index:
+            return 1
+        elif i == false_sink_index:
+            return 0
+        return s - 1 - i
+    if root_index == false_sink_index:
+        # unsatisfiable : only the False sink, which is then the root
+        s = 1
+    if bead_table:
+        relabled_beads = BeadTable.zeros(s)
+        set_bead = relabled_beads.set
+    else:
+        relabled_beads = {}
+        def set_bead(key, v, l, h):
+            relabled_beads[key] = (v, l, h)
+    if s > 1:
+        set_bead(1, n_edges, 1, 1)
+    set_bead(0, n_edges, 0, 0)
+    for k in xrange(s - 2):
+        set_bead(r(k), variables[k], r(lows[k]), r(highs[k]))
     return relabled_beads
 
+def resume_connectedness_tree(checkpoint, vertex_order, edge_order, frontiers,
+        **kwargs):
+    """
+    carry on a make_connectedness_tree build from its checkpoint file, which
+    goes on being updated. vertex_order, edge_order and frontiers must be the
+    same as for the interrupted build, and kwargs are passed on as for it
+    """
+    if not os.path.exists(checkpoint):
+        raise ValueError('no checkpoint %s' % checkpoint)
+    return make_connectedness_tree(
+        vertex_order, edge_order, frontiers,
+        checkpoint = checkpoint, resume = True, **kwargs
+    )
+
+# checkpoint file format, all little endian:
+#
+#   header, CHECKPOINT_HEADER_SIZE bytes :
+#       magic 'BEADCKPT', format version, bytes per bead entry, depth,
+#       number of beads so far, number of states at depth, characters per
+#       state, bytes per character, key of the steps before depth
+#       (step_prefix_keys) as 32 hex digits, zero padding
+#   var, lo, hi : an entry for each bead so far, by index
+#   states : the states at depth, in order of index, back to back. states at
+#       one depth all have the same length
+#
+# the states at depth have indices following on from the beads, so no
+# indices need saving
+
+CHECKPOINT_MAGIC = 'BEADCKPT'
+CHECKPOINT_VERSION = 1
+CHECKPOINT_HEADER_FORMAT = '<8sIIqqqII32s'
+CHECKPOINT_HEADER_SIZE = 96
+# default seconds between checkpoints
+CHECKPOINT_INTERVAL = 600.0
+
+def save_checkpoint(file_name, depth, key, variables, lows, highs, states):
+    """
+    write a checkpoint, atomically : it goes to a temporary file that is
+    then renamed over file_name, so a crash while saving leaves the last
+    checkpoint intact
+    """
+    width = len(states[0]) if states else 0
+    if states and isinstance(states[0], unicode):
+        char_size = 4
+        packed = u''.join(states).encode('utf-32-le')
+    else:
+        char_size = 1
+        packed = ''.join(states)
+    itemsize = array(TYPECODE).itemsize
+    header = struct.pack(
+        CHECKPOINT_HEADER_FORMAT, CHECKPOINT_MAGIC, CHECKPOINT_VERSION,
+        itemsize, depth, len(variables), len(states), width, char_size, key,
+    )
+    temp_name = file_name + '.tmp'
+    out_file = open(temp_name, 'wb')
+    try:
+        out_file.write(header.ljust(CHECKPOINT_HEADER_SIZE, '\0'))
+        for a in (variables, lows, highs):
+            if sys.byteorder != 'little':
+                a = array(TYPECODE, a)
+                a.byteswap()
+            a.tofile(out_file)
+        out_file.write(packed)
+        out_file.flush()
+        os.fsync(out_file.fileno())
+    finally:
+        out_file.close()
+    os.rename(temp_name, file_name)
+
+def load_checkpoint(file_name, to_chr):
+    """
+    read a checkpoint written by save_checkpoint, returning a dict of depth,
+    key, variables, lows, highs and states
+    """
+    in_file = open(file_name, 'rb')
+    try:
+        header = in_file.read(CHECKPOINT_HEADER_SIZE)
+        if (len(header) < CHECKPOINT_HEADER_SIZE or
+                not header.startswith(CHECKPOINT_MAGIC)):
+            raise ValueError('%s is not a checkpoint file' % file_name)
+        (_, version, itemsize, depth, n_beads, n_states, width, char_size,
+            key) = struct.unpack_from(CHECKPOINT_HEADER_FORMAT, header)
+        if version != CHECKPOINT_VERSION:
+            raise ValueError('unsupported checkpoint version %d' % version)
+        if itemsize != array(TYPECODE).itemsize:
+            raise ValueError('unsupported checkpoint entry size %d' % itemsize)
+        arrays = []
+        for _ in xrange(3):
+            a = array(TYPECODE)
+            a.fromfile(in_file, n_beads)
+            if sys.byteorder != 'little':
+                a.byteswap()
+            arrays.append(a)
+        packed = in_file.read(n_states * width * char_size)
+        if len(packed) != n_states * width * char_size:
+            raise ValueError('checkpoint %s is truncated' % file_name)
+    finally:
+        in_file.close()
+    if char_size == 4:
+        packed = packed.decode('utf-32-le')
+    states = [packed[i * width:(i + 1) * width] for i in xrange(n_states)]
+    if width == 0:
+        states = [to_chr(0)[:0]] * n_states
+    variables, lows, highs = arrays
+    return dict(
+        depth = depth,
+        key = key,
+        variables = variables,
+        lows = lows,
+        highs = highs,
+        states = states,
+    )
+
+"""
+algorithm R, Knuth
+"""
 def reduce_beads(beads, verbose = True):
-    s = len(beads)
-    redirect = {}
-    cache = {}
+    """
+    reduce the BDD given by beads (a dict or BeadTable, with key 0 the False
+    sink, key 1 the True sink and the root the largest key), returning the
+    reduced BDD as the same type with monotone keys 0, ..., s - 1.
+
+    this takes time linear in the number of beads and never recurses. beads
+    reachable from the root are bucketed by variable, then each bucket is
+    reduced from the bottom up. every branch then already points at a reduced
+    bead, so a bead is redundant if its branches agree and a duplicate if its
+    (lo, hi) pair has been seen before in its bucket. each input key maps
+    straight to its final output key, so no redirect chain is ever followed,
+    and output keys are handed out in bottom-up order so the result is
+    monotone without any sorting.
+    """
+    root_key = max(beads)
+    sink_variable = beads[0][0]
+    v_root = beads[root_key][0]
+
     if verbose:
         print 'reduce : making layers'
-
-    layers = {}
-    for (key, (v, l, r)) in beads.iteritems():
-        if v not in layers:
-            layers[v] = []
-        layers[v].append((key, (v, l, r)))
-    layer_variables = sorted(layers.keys(), reverse = True)
-
-    def get_repr(key):
-        while key in redirect:
-            next_key = redirect[key]
-            if next_key == key:
-                break
-            else:
-                key = next_key
-        return key
+    # bucket the beads reachable from the root by variable, from the top down
+    layers = {v_root : [root_key]}
+    seen = set([0, 1, root_key])
+    for variable in xrange(v_root, sink_variable):
+        for key in layers.get(variable, ()):
+            _, l, h = beads[key]
+            for child in (l, h):
+                if child not in seen:
+                    seen.add(child)
+                    v_child = beads[child][0]
+                    if v_child not in layers:
+                        layers[v_child] = []
+                    layers[v_child].append(child)
+    del seen
 
     if verbose:
         print 'reduce : building redirects'
+    reduced_beads = BeadTable()
+    reduced_beads.append(sink_variable, 0, 0)
+    reduced_beads.append(sink_variable, 1, 1)
+    # redirect[key] is the output key of the bead that input key reduces to
+    redirect = {0 : 0, 1 : 1}
     # iterate over beads in decreasing variable order
-    for variable in layer_variables:
-        layer = layers[variable]
-        for key, (v, l, r) in layer:
-            l = get_repr(l)
-            r = get_repr(r)
-            if l == r:
+    for variable in xrange(sink_variable - 1, v_root - 1, -1):
+        cache = {}
+        for key in layers.pop(variable, ()):
+            _, l, h = beads[key]
+            l = redirect[l]
+            h = redirect[h]
+            if l == h:
                 redirect[key] = l
-            elif (v, l, r) in cache:
-                redirect[key] = cache[(v, l, r)]
+            elif (l, h) in cache:
+                redirect[key] = cache[(l, h)]
             else:
-                cache[(v, l, r)] = key
+                redirect[key] = cache[(l, h)] = reduced_beads.append(variable, l, h)
 
-    if verbose:
-        print 'reduce : walking'
-    s = len(beads)
-    root_key = s - 1
-    reduced_beads = {}
-
-    def walk(key):
-        key = get_repr(key)
-        if key in reduced_beads:
-            return
-        (v, l, r) = beads[key]
-        l = get_repr(l)
-        r = get_repr(r)
-        reduced_beads[key] = (v, l, r)
-        if l != key:
-            walk(l)
-        if r != key:
-            walk(r)
-
-    walk(root_key)
     if verbose:
         print 'reduce : finished, returning'
-    #XXX TODO fix keying? sigh.
-    return rekey_monotone(reduced_beads)
+    if redirect[root_key] == 0:
+        # unsatisfiable : only the False sink remains
+        reduced_beads = BeadTable.from_dict({0 : reduced_beads[0]})
+    assert redirect[root_key] == len(reduced_beads) - 1
+    if isinstance(beads, BeadTable):
+        return reduced_beads
+    return reduced_beads.to_dict()
 
 def rekey_monotone(beads):
+    """
+    rekey beads to 0, ..., s - 1 preserving key order. the result has the same
+    type (dict or BeadTable) as the input
+    """
     r = {}
     for i, j in enumerate(sorted(beads.keys())):
         r[j] = i
-    relabled_beads = {}
-    def relabel(key):
-        v, l, h = beads[key]
-        relabled_beads[r[key]] = (v, r[l], r[h])
+    if isinstance(beads, BeadTable):
+        relabled_beads = BeadTable.zeros(len(beads))
+        def relabel(key):
+            v, l, h = beads[key]
+            relabled_beads.set(r[key], v, r[l], r[h])
+    else:
+        relabled_beads = {}
+        def relabel(key):
+            v, l, h = beads[key]
+            relabled_beads[r[key]] = (v, r[l], r[h])
     for key in beads:
         relabel(key)
     return relabled_beads
@@ -8,46 +8,135 @@ can run the following to layout and plot the graph:
 
     dot -v -Tpng -O bdd.gv
     eog bdd.gv.png
+
+beads may be given as a dict or as a bead_table.BeadTable.
+
+The BDD is walked a layer (variable) at a time from arrays, and the output
+is written in large buffered chunks, gzip compressed if the file name ends
+in '.gz' (dot does not read these, so gunzip them first). For big BDDs give
+a max_nodes budget : layers too wide for their share of the budget are
+collapsed, showing some of their beads and one summary node standing in
+for the rest, labelled with how many beads it hides. Edges into hidden
+beads go to the summary node, so the shape of the BDD is still visible:
+
+    export_dot_graph(beads, 'bdd.gv', max_nodes = 500)
 """
 
-def export_dot_graph(beads, file_name):
-    out_file = open(file_name, 'w')
-    write_line = lambda s : out_file.write(s + '\n')
-    write_line('digraph tree {')
-    write_line('\tgraph []')
-    layers = {}
-    for (key, (v, l, r)) in beads.iteritems():
-        if v not in layers:
-            layers[v] = []
-        layers[v].append((key, (v, l, r)))
-    for value in sorted(layers):
-        layer_beads = layers[value]
-        write_line('\t{')
-        write_line('\t\trank = same;')
-        for index, bead in layer_beads:
-            (value, left_index, right_index) = bead
-            write_line('\t\t"%d" [label="%d"];' % (index, value))
-        write_line('\t}')
-        write_line('\t{')
-        for index, bead in layer_beads:
-            (value, left_index, right_index) = bead
-            if left_index == index and right_index == index:
-                is_sink = True
-            elif left_index != index and right_index != index:
-                is_sink = False
-            else:
-                raise ValueError('bad bead : %s' % str(bead))
-            if is_sink:
-                # n.b. html entity (decimal) for unicode uptack (upside down T)
-                label = 'T' if index else '&#8869;'
-                write_line('\t\t"%d" [label="%s", shape = box];' % (index, label))
-            else:
-                write_line('\t\t"%d" [label="%d", shape = circle];' % (index, value))
-                write_line('\t\t"%d" -> "%d" [style=dashed];' % (index, left_index))
-                write_line('\t\t"%d" -> "%d" [style=solid];' % (index, right_index))
-
-        write_line('\t}')
-    write_line('}')
-    out_file.close()
+import gzip
+
+import numpy
+
+from bdd_vector import bdd_arrays
+
+# bytes of output to gather before each write
+BUFFER_SIZE = 1 << 16
+
+def make_writer(out_file, buffer_size = BUFFER_SIZE):
+    """
+    return (write_line, flush) buffering lines for out_file
+    """
+    lines = []
+    size = [0]
+    def flush():
+        out_file.write(''.join(lines))
+        del lines[:]
+        size[0] = 0
+    def write_line(s):
+        lines.append(s + '\n')
+        size[0] += len(s) + 1
+        if size[0] >= buffer_size:
+            flush()
+    return write_line, flush
+
+def layer_budgets(widths, max_nodes):
+    """
+    share max_nodes between layers of the given widths : narrow layers get
+    all they need and the rest is split evenly between the wide ones. every
+    layer gets at least one node
+    """
+    budgets = list(widths)
+    if max_nodes is None or sum(widths) <= max_nodes:
+        return budgets
+    remaining = max_nodes
+    by_width = sorted(xrange(len(widths)), key = lambda i : widths[i])
+    for n_done, i in enumerate(by_width):
+        share = remaining // (len(widths) - n_done)
+        budgets[i] = max(1, min(widths[i], share))
+        remaining -= budgets[i]
+    return budgets
+
+def export_dot_graph(beads, file_name, max_nodes = None):
+    var, lo, hi = bdd_arrays(beads)
+    s = len(var)
+
+    # group keys by variable, root layer first and the sinks last. within a
+    # layer, keys run from the top (largest) down
+    order = numpy.lexsort((-numpy.arange(s), var))
+    variables, starts = numpy.unique(var[order], return_index = True)
+    ends = list(starts[1:]) + [s]
+    layers = [
+        (int(v), order[start:end])
+        for (v, start, end) in zip(variables, starts, ends)
+    ]
+    budgets = layer_budgets([len(keys) for (_, keys) in layers], max_nodes)
 
+    # beads of a collapsed layer that are not drawn are shown by the layer's
+    # summary node
+    collapsed = numpy.zeros(s, dtype = numpy.bool_)
+    drawn = []
+    for (v, keys), budget in zip(layers, budgets):
+        if budget >= len(keys) or v == var[0]:
+            drawn.append((v, keys, None))
+            continue
+        # one node goes on the summary, leaving budget - 1 beads drawn
+        collapsed[keys[budget - 1:]] = True
+        drawn.append((v, keys[:budget - 1], keys[budget - 1:]))
+    def node(k):
+        if collapsed[k]:
+            return '"v%d"' % var[k]
+        return '"%d"' % k
 
+    if file_name.endswith('.gz'):
+        out_file = gzip.open(file_name, 'wb')
+    else:
+        out_file = open(file_name, 'w')
+    try:
+        write_line, flush = make_writer(out_file)
+        write_line('digraph tree {')
+        write_line('\tgraph []')
+        for v, shown, hidden in drawn:
+            write_line('\t{')
+            write_line('\t\trank = same;')
+            for k in shown:
+                write_line('\t\t"%d" [label="%d"];' % (k, v))
+            if hidden is not None:
+                write_line('\t\t"v%d";' % v)
+            write_line('\t}')
+            write_line('\t{')
+            for k in shown:
+                if k < 2:
+                    # nb sinks are keys 0 and 1, whatever their branches.
+                    # html entity (decimal) for unicode uptack (upside down T)
+                    label = 'T' if k else '&#8869;'
+                    write_line('\t\t"%d" [label="%s", shape = box];' % (k, label))
+                    continue
+                write_line('\t\t"%d" [label="%d", shape = circle];' % (k, v))
+                write_line('\t\t"%d" -> %s [style=dashed];' % (k, node(lo[k])))
+                write_line('\t\t"%d" -> %s [style=solid];' % (k, node(hi[k])))
+            if hidden is not None:
+                write_line(
+                    '\t\t"v%d" [label="x%d : %d more", shape = box, '
+                    'style = dotted];' % (v, v, len(hidden))
+                )
+                # one edge to each node the hidden beads lead to
+                for style, branches in (('dashed', lo), ('solid', hi)):
+                    targets = numpy.unique(branches[hidden])
+                    for target in sorted(set(node(k) for k in targets)):
+                        write_line('\t\t"v%d" -> %s [style=%s];' % (
+                            v, target, style,
+                        ))
+            write_line('\t}')
+        write_line('}')
+        flush()
+    finally:
+        out_file.close()
@@ -8,7 +8,7 @@ import numpy
 from connection import order_vertices, order_edges, make_frontiers, \
     make_connectedness_tree, reduce_beads
 
-from bdd import bdd_count_solutions, bdd_generate_random_solution
+from bdd_vector import bdd_count_layered, bdd_sample_solutions
 
 def make_grid(n):
     """
@@ -32,16 +32,15 @@ def gen_random_solutions(beads, how_many):
         's' : len(beads),
         'dag' : beads,
     }
-    c = {}
-    n_solns = bdd_count_solutions(bdd_beads, c)
+    n_solns, _ = bdd_count_layered(bdd_beads)
     print 'number of solutions : %d' % n_solns
     print 'here are a few random ones:'
-    for _ in xrange(how_many):
-        yield bdd_generate_random_solution(
+    for soln in bdd_sample_solutions(
             bdd_beads,
-            c,
-            rand = numpy.random.rand
-        )
+            how_many,
+            rng = numpy.random.RandomState(),
+        ):
+        yield soln
 
 def main():
     # trying anything above n = 5 may prove a bit foolish
@@ -7,7 +7,8 @@ import numpy
 from connection import order_vertices, order_edges, make_frontiers, \
     make_connectedness_tree, reduce_beads
 
-from bdd import bdd_count_solutions, bdd_generate_random_solution
+from ordering import find_vertex_order
+from bdd_vector import bdd_count_layered, bdd_sample_solutions
 
 def make_grid_graph(n):
     """
@@ -46,19 +47,21 @@ def gen_random_solutions(beads, how_many):
         's' : len(beads),
         'dag' : beads,
     }
-    c = {}
-    n_solns = bdd_count_solutions(bdd_beads, c)
+    n_solns, _ = bdd_count_layered(bdd_beads)
     print 'number of solutions : %d' % n_solns
     print 'here are a few random ones:'
-    for _ in xrange(how_many):
-        yield bdd_generate_random_solution(
+    for soln in bdd_sample_solutions(
             bdd_beads,
-            c,
-            rand = numpy.random.rand
-        )
-
-def make_bdd(vertices, edges, root):
-    vertex_order = order_vertices(vertices, edges, root)
+            how_many,
+            rng = numpy.random.RandomState(),
+        ):
+        yield soln
+
+def make_bdd(vertices, edges, root = None):
+    if root is None:
+        vertex_order = find_vertex_order(vertices, edges, verbose = True)
+    else:
+        vertex_order = order_vertices(vertices, edges, root)
     edge_order = order_edges(vertices, edges, vertex_order)
     frontiers = make_frontiers(vertex_order, edge_order)
 
@@ -131,8 +134,8 @@ def main():
 
     c_vertices, c_edges = make_bmp_graph(coarse_bmp)
     print 'n vertices: %d; n edges: %d' % (len(c_vertices), len(c_edges))
-    c_root = min(c_vertices)
-    beads, edge_order, vertex_order = make_bdd(c_vertices, c_edges, c_root)
+    # irregular graph : let the ordering search pick the vertex ordering
+    beads, edge_order, vertex_order = make_bdd(c_vertices, c_edges)
 
     for soln in gen_random_solutions(beads, how_many = 25):
         bmp = make_bmp(coarse_bmp.shape[0], edge_order, vertex_order, soln)
@@ -5,7 +5,7 @@ Plot uniformly sampled random connected subgraphs of n*n grid.
 from connection import order_vertices, order_edges, make_frontiers, \
     make_connectedness_tree, reduce_beads
 
-from bdd import bdd_count_solutions, bdd_generate_random_solution
+from bdd_vector import bdd_count_layered
 
 def make_grid(n):
     """
@@ -36,8 +36,8 @@ def count_em(n):
         frontiers,
     )
     beads = reduce_beads(beads, verbose = False)
-    count = bdd_count_solutions({'s' : len(beads), 'dag' : beads})
-    print count * 2
+    count, _ = bdd_count_layered({'s' : len(beads), 'dag' : beads})
+    print count
 
 def main():
     for n in xrange(2, 5 + 1):
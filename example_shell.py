@@ -2,13 +2,13 @@
 Plot uniformly sampled random connected subgraphs of a shell thing.
 """
 
-import pylab
 import numpy
 
-from connection import order_vertices, order_edges, make_frontiers, \
+from connection import order_edges, make_frontiers, \
     make_connectedness_tree, reduce_beads
 
-from bdd import bdd_count_solutions, bdd_generate_random_solution
+from ordering import find_vertex_order
+from bdd_vector import bdd_count_layered, bdd_sample_solutions
 
 def make_shell_graph(n, m):
     """
@@ -33,27 +33,30 @@ def gen_random_solutions(beads, how_many):
         's' : len(beads),
         'dag' : beads,
     }
-    c = {}
-    n_solns = bdd_count_solutions(bdd_beads, c)
+    n_solns, _ = bdd_count_layered(bdd_beads)
     print 'number of solutions : %d' % n_solns
     print 'here are a few random ones:'
-    for _ in xrange(how_many):
-        yield bdd_generate_random_solution(
+    for soln in bdd_sample_solutions(
             bdd_beads,
-            c,
-            rand = numpy.random.rand
-        )
+            how_many,
+            rng = numpy.random.RandomState(),
+        ):
+        yield soln
 
 def main():
+    # nb imported here, so that make_shell_graph (eg for bench.py) does not
+    # need matplotlib
+    import pylab
+
     # trying anything above n = 5 may prove a bit foolish
     n = 7
     m = 2
     print 'making a %d^2 \\ %d^2 shell' % (n, m)
     vertices, edges = make_shell_graph(n, m)
-    # experiment: trying to fix roots
-    central_root = (n/2, ) * 2 # this seems to work poorly
-    corner_root = (0, ) * 2
-    vertex_order = order_vertices(vertices, edges, root = corner_root)
+    # search for a vertex ordering with a narrow frontier, rather than
+    # fixing a root by hand (a corner beats a central root, but the best
+    # ordering for a shell need not be a BFS from either)
+    vertex_order = find_vertex_order(vertices, edges, verbose = True)
     edge_order = order_edges(vertices, edges, vertex_order)
     frontiers = make_frontiers(vertex_order, edge_order)
 
@@ -0,0 +1,130 @@
+"""
+Per-depth instrumentation for building connectedness BDDs.
+
+make_connectedness_tree (and make_connectedness_tree_on_disk) take a
+monitor : a function called with a record (a dict) as each depth finishes,
+
+    depth : the depth (edge) just decided
+    states_in : states at this depth, ie beads made
+    states_out : distinct states passed on to the next depth
+    true_sinks, false_sinks : branches that went straight to a sink
+    cache_hits : branches to a state already seen at the next depth
+    cache_hit_rate : cache_hits over the branches not going to a sink
+    seconds : wall time spent on this depth
+    elapsed : wall time since the start of the build
+    peak_rss : peak resident memory of the process so far, in bytes
+
+make_monitor makes one that writes the records as JSON lines, eg to plot
+later, and enforces a budget on states and memory. Once a depth goes over
+budget it raises BudgetExceeded, so that a hopeless ordering fails after
+seconds rather than hours:
+
+    monitor = make_monitor(open('grid.jsonl', 'w'), max_states = 10 ** 6)
+    try:
+        beads = make_connectedness_tree(
+            vertex_order, edge_order, frontiers, monitor = monitor,
+        )
+    except BudgetExceeded, e:
+        print e
+"""
+
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # eg on windows
+    resource = None
+
+class BudgetExceeded(Exception):
+    """
+    raised when a build goes over budget. record is the record of the depth
+    that went over
+    """
+    def __init__(self, message, record):
+        Exception.__init__(self, message)
+        self.record = record
+
+def peak_rss():
+    """
+    peak resident memory of this process in bytes, or None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # nb ru_maxrss is in bytes on mac os, kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def make_depth_timer(true_sink, false_sink):
+    """
+    return record(depth, states_in, states_out, lows, highs), which builds
+    the record for a finished depth from the branches of its beads. branches
+    to the sinks are given by the indices true_sink and false_sink. a caller
+    that does not keep the branches can count them itself and pass
+    sinks = (true sinks, false sinks) instead of lows and highs
+    """
+    start = [time.time()]
+    first = start[0]
+    def record(depth, states_in, states_out, lows = None, highs = None,
+            sinks = None):
+        now = time.time()
+        if sinks is None:
+            true_sinks = lows.count(true_sink) + highs.count(true_sink)
+            false_sinks = lows.count(false_sink) + highs.count(false_sink)
+        else:
+            true_sinks, false_sinks = sinks
+        lookups = 2 * states_in - true_sinks - false_sinks
+        cache_hits = lookups - states_out
+        result = dict(
+            depth = depth,
+            states_in = states_in,
+            states_out = states_out,
+            true_sinks = true_sinks,
+            false_sinks = false_sinks,
+            cache_hits = cache_hits,
+            cache_hit_rate = float(cache_hits) / lookups if lookups else 0.0,
+            seconds = now - start[0],
+            elapsed = now - first,
+            peak_rss = peak_rss(),
+        )
+        start[0] = now
+        return result
+    return record
+
+def make_monitor(out_file = None, max_states = None, max_rss = None,
+        verbose = False):
+    """
+    return a monitor that writes each record to out_file as a line of JSON,
+    and raises BudgetExceeded once a depth passes on more than max_states
+    states or the peak resident memory passes max_rss bytes. with verbose the
+    records are printed too
+    """
+    def monitor(record):
+        if out_file is not None:
+            out_file.write(json.dumps(record, sort_keys = True) + '\n')
+            out_file.flush()
+        if verbose:
+            print (
+                'depth %(depth)d: states %(states_in)d -> %(states_out)d, '
+                'cache hit rate %(cache_hit_rate).3f, %(seconds).2fs'
+            ) % record
+        problems = []
+        if max_states is not None and record['states_out'] > max_states:
+            problems.append('%d states > max_states %d' % (
+                record['states_out'], max_states,
+            ))
+        rss = record['peak_rss']
+        if max_rss is not None and rss is not None and rss > max_rss:
+            problems.append('peak rss %.1f MiB > max_rss %.1f MiB' % (
+                rss / float(1 << 20), max_rss / float(1 << 20),
+            ))
+        if problems:
+            raise BudgetExceeded(
+                'over budget after depth %d (%.1fs elapsed) : %s' % (
+                    record['depth'], record['elapsed'], ', '.join(problems),
+                ),
+                record,
+            )
+    return monitor
@@ -0,0 +1,302 @@
+"""
+Choosing a vertex ordering that keeps the connectedness BDD small.
+
+make_connectedness_tree only remembers how the vertices on the frontier
+are connected, so the number of states at each depth is at most the number
+of partitions of the frontier (a Bell number), and usually far fewer. The
+frontier sizes only depend on the ordering, so an ordering can be scored
+without building anything :
+
+    order_cost(vertex_order, edges) -> (max frontier width, estimated states)
+
+find_vertex_order then searches for a cheap ordering, trying BFS orderings
+(as order_vertices) and greedy frontier-minimising orderings (a path
+decomposition heuristic) from several roots, and then improving the best of
+those by swapping neighbouring vertices. The search is bounded by a number
+of evaluations, so it gives the same ordering every time, and optionally by
+a time budget as well:
+
+    vertex_order = find_vertex_order(vertices, edges, max_evaluations = 10000)
+    edge_order = order_edges(vertices, edges, vertex_order)
+"""
+
+import itertools
+import time
+
+from connection import order_vertices, order_edges, make_frontiers
+
+def bell_numbers(n):
+    """
+    the Bell numbers B_0, ..., B_n, via the Bell triangle
+    """
+    bell = [1]
+    row = [1]
+    for _ in xrange(n):
+        next_row = [row[-1]]
+        for x in row:
+            next_row.append(next_row[-1] + x)
+        row = next_row
+        bell.append(row[0])
+    return bell
+
+BELL = bell_numbers(64)
+
+# default number of orderings or swaps find_vertex_order scores
+MAX_EVALUATIONS = 5000
+
+def frontier_widths(vertex_order, edges):
+    """
+    size of the frontier after each edge, for the given vertex ordering
+    """
+    edge_order = order_edges(None, edges, vertex_order)
+    return [len(f) for f in make_frontiers(vertex_order, edge_order)]
+
+def order_cost(vertex_order, edges):
+    """
+    predict the cost of building the connectedness BDD with this vertex
+    ordering, returning (max frontier width, estimated number of states).
+    the estimate bounds the states at each depth by both the number of
+    partitions of the frontier and the number of paths down the tree
+    """
+    widths = frontier_widths(vertex_order, edges)
+    estimate = sum(depth_cost(depth, width) for depth, width in enumerate(widths))
+    return (max(widths + [0]), estimate)
+
+def depth_cost(depth, width):
+    """
+    the bound on the number of states at depth used by order_cost
+    """
+    partitions = BELL[width] if width < len(BELL) else BELL[-1]
+    return min(partitions, 2 ** min(depth + 1, 64))
+
+def greedy_frontier_order(vertices, edges, root):
+    """
+    order vertices starting from root, each time adding the neighbour of the
+    vertices so far that leaves the smallest frontier (the vertices so far
+    with neighbours still to come). ties go to the vertex with the fewest
+    neighbours still to come, then to the earliest one reached
+    """
+    unplaced_degree = dict((v, len(edges.get(v, ()))) for v in vertices)
+    placed = set()
+    ordering = []
+    # candidates adjacent to the placed vertices, with the order reached
+    reached = {}
+    reach_counter = itertools.count()
+
+    def place(v):
+        placed.add(v)
+        ordering.append(v)
+        reached.pop(v, None)
+        for w in edges.get(v, ()):
+            unplaced_degree[w] -= 1
+            if w not in placed and w not in reached:
+                reached[w] = next(reach_counter)
+
+    place(root)
+    while len(ordering) < len(unplaced_degree):
+        if not reached:
+            # disconnected graph : start again somewhere new
+            place(min(v for v in unplaced_degree if v not in placed))
+            continue
+        def score(c):
+            # placing c retires each placed neighbour with no other neighbours
+            # to come, and adds c itself to the frontier if it has any
+            retiring = sum(
+                1 for w in edges.get(c, ())
+                if w in placed and unplaced_degree[w] == 1
+            )
+            joining = 1 if unplaced_degree[c] > 0 else 0
+            return (joining - retiring, unplaced_degree[c], reached[c])
+        place(min(reached, key = score))
+    return ordering
+
+def make_swap_widths(vertex_order, edges):
+    """
+    return (widths, swap_widths, swap) for trying swaps of neighbouring
+    vertices without redoing the frontiers of the whole ordering. widths
+    are the frontier widths of the ordering so far.
+
+    swap_widths(i) gives the frontier widths that change if the vertices at
+    positions i and i + 1 are swapped, as a list of (depth, width). the edge
+    order only changes for the edges of those two vertices : the edges from
+    each earlier vertex to both of them change places, and the edges from
+    the two of them to later vertices are reordered. so only those depths
+    are redone, each from the width before it and the number of edges each
+    vertex has had so far. swap(i, changes) makes the swap, given the
+    changes swap_widths(i) found.
+
+    vertex_order and widths are changed in place by swap
+    """
+    neighbours = dict(
+        (v, [w for w in edges.get(v, ()) if w != v]) for v in vertex_order
+    )
+    position = dict((v, p) for (p, v) in enumerate(vertex_order))
+    widths = frontier_widths(vertex_order, edges)
+    # block_start[p] is the depth of the first edge from the vertex at p to
+    # a later one
+    block_start = [0]
+    for v in vertex_order:
+        block_start.append(block_start[-1] + sum(
+            1 for w in neighbours[v] if position[w] > position[v]
+        ))
+
+    def redo(depth, run, seen, changes):
+        """
+        redo the widths of the edges of run, a list of (u, v) starting at
+        depth, where seen counts the edges each endpoint had before it
+        """
+        width = widths[depth - 1] if depth else 0
+        for u, v in run[:-1]:
+            for w in (u, v):
+                degree = len(neighbours[w])
+                before = 0 < seen[w] < degree
+                seen[w] += 1
+                width += (0 < seen[w] < degree) - before
+            changes.append((depth, width))
+            depth += 1
+
+    def swap_widths(i):
+        x, y = vertex_order[i], vertex_order[i + 1]
+        changes = []
+        # each earlier neighbour of x and y decides its edges to them as a
+        # run, whose order is reversed
+        earlier = set(
+            a for a in neighbours[x] + neighbours[y] if position[a] < i
+        )
+        for a in sorted(earlier, key = position.get):
+            targets = [w for w in neighbours[a] if w in (x, y)]
+            if x not in targets or y not in targets:
+                continue
+            p = position[a]
+            depth = block_start[p] + sum(
+                1 for w in neighbours[a] if p < position[w] < i
+            )
+            run = [(a, w) for w in targets if w == y] + \
+                [(a, w) for w in targets if w == x]
+            seen = {
+                a : sum(1 for w in neighbours[a] if position[w] < i),
+                x : sum(1 for w in neighbours[x] if position[w] < p),
+                y : sum(1 for w in neighbours[y] if position[w] < p),
+            }
+            redo(depth, run, seen, changes)
+        # then the edges from y and x to later vertices, in their new order
+        new_position = lambda w : {x : i + 1, y : i}.get(w, position[w])
+        run = []
+        seen = {}
+        for u in (y, x):
+            later = [w for w in neighbours[u] if new_position(w) > new_position(u)]
+            run.extend((u, w) for w in sorted(later, key = new_position))
+        for u, v in run:
+            for w in (u, v):
+                if w not in seen:
+                    seen[w] = sum(1 for t in neighbours[w] if position[t] < i)
+        if run:
+            redo(block_start[i], run, seen, changes)
+        return changes
+
+    def swap(i, changes):
+        x, y = vertex_order[i], vertex_order[i + 1]
+        vertex_order[i], vertex_order[i + 1] = y, x
+        position[x], position[y] = i + 1, i
+        block_start[i + 1] = block_start[i] + sum(
+            1 for w in neighbours[y] if position[w] > i
+        )
+        for depth, width in changes:
+            widths[depth] = width
+
+    return widths, swap_widths, swap
+
+def improve_by_swaps(vertex_order, edges, cost, max_evaluations,
+        deadline = None):
+    """
+    swap neighbouring vertices (never the root) while that lowers the cost,
+    until no swap helps, max_evaluations swaps have been tried or the
+    deadline (if any) passes. returns the ordering, its cost and the number
+    of swaps tried
+    """
+    vertex_order = list(vertex_order)
+    widths, swap_widths, swap = make_swap_widths(vertex_order, edges)
+    # how many depths have each width, to keep track of the widest
+    width_counts = [0] * (max(widths + [0]) + 2)
+    for width in widths:
+        width_counts[width] += 1
+    evaluations = 0
+    improved = True
+    while improved:
+        improved = False
+        for i in xrange(1, len(vertex_order) - 1):
+            if evaluations >= max_evaluations or (
+                    deadline is not None and time.time() >= deadline):
+                return vertex_order, cost, evaluations
+            evaluations += 1
+            changes = swap_widths(i)
+            estimate = cost[1]
+            max_width = cost[0]
+            for depth, width in changes:
+                estimate += depth_cost(depth, width) - depth_cost(depth, widths[depth])
+                max_width = max(max_width, width)
+            if max_width == cost[0]:
+                # the widest depths may all have narrowed
+                counts = {}
+                for depth, width in changes:
+                    counts[widths[depth]] = counts.get(widths[depth], 0) - 1
+                    counts[width] = counts.get(width, 0) + 1
+                while max_width > 0 and (
+                        width_counts[max_width] + counts.get(max_width, 0) == 0):
+                    max_width -= 1
+            candidate_cost = (max_width, estimate)
+            if candidate_cost[::-1] < cost[::-1]:
+                for depth, width in changes:
+                    if width >= len(width_counts):
+                        width_counts.extend([0] * (width + 1 - len(width_counts)))
+                    width_counts[widths[depth]] -= 1
+                    width_counts[width] += 1
+                swap(i, changes)
+                cost = candidate_cost
+                improved = True
+    return vertex_order, cost, evaluations
+
+def find_vertex_order(vertices, edges, time_budget = None, roots = None,
+        verbose = False, max_evaluations = MAX_EVALUATIONS):
+    """
+    search for a vertex ordering with a small predicted BDD, scoring at most
+    max_evaluations orderings or swaps : up to half of them on orderings
+    from different roots and the rest on swaps. the result only depends on
+    the graph, unless time_budget is given, which also stops the search
+    after about that many seconds. roots are the vertices to try starting
+    from, by default every vertex, lowest degree first (eg the corners of
+    a grid). orderings that miss some vertices, eg a BFS of one component
+    of a disconnected graph, are passed over
+    """
+    deadline = None if time_budget is None else time.time() + time_budget
+    if roots is None:
+        roots = sorted(vertices, key = lambda v : (len(edges.get(v, ())), v))
+
+    best_order, best_cost = None, None
+    evaluations = 0
+    for root in roots:
+        for make_order in (order_vertices, greedy_frontier_order):
+            candidate = make_order(vertices, edges, root)
+            if len(candidate) < len(vertices):
+                continue
+            cost = order_cost(candidate, edges)
+            evaluations += 1
+            # compare estimated states first, then max width
+            if best_cost is None or cost[::-1] < best_cost[::-1]:
+                best_order, best_cost = candidate, cost
+                if verbose:
+                    print 'ordering : root %s by %s, width %d, cost %d' % (
+                        root, make_order.__name__, cost[0], cost[1],
+                    )
+        if evaluations >= max_evaluations // 2 or (
+                deadline is not None and time.time() >= deadline):
+            break
+
+    best_order, best_cost, swaps = improve_by_swaps(
+        best_order, edges, best_cost, max_evaluations - evaluations, deadline,
+    )
+    if verbose:
+        print 'ordering : after %d swaps tried, width %d, cost %d' % (
+            (swaps, ) + best_cost
+        )
+    return best_order
@@ -0,0 +1,466 @@
+"""
+Building the connectedness BDD out of core, for graphs whose unreduced BDD
+does not fit in memory.
+
+make_connectedness_tree keeps every bead, the states of the current depth
+and a dict of the states of the next depth in memory at once. Here instead
+
+    *   each finished layer of beads is appended to files on disk as soon as
+        it is made, so only one layer is ever held in memory;
+    *   the states of each depth live in a file, read back sequentially;
+    *   once a depth could produce more than max_states new states, they are
+        deduplicated by external hashing : the successor states are
+        scattered over bucket files by hash, each bucket is deduplicated in
+        memory on its own, and the buckets are merged back (by a heap merge
+        on position of first appearance) into one file, in index order.
+        the indices found for each bucket's states are then looked up for
+        every branch into the bucket, bucket by bucket, and the branches
+        merged back into order by a second heap merge;
+    *   branches are written to disk in chunks as they are resolved.
+
+States are numbered exactly as by make_connectedness_tree, and the result
+is the same BDD, written to file_name in the bead_table binary format and
+returned memory-mapped:
+
+    beads = make_connectedness_tree_on_disk(
+        vertex_order, edge_order, frontiers, 'grid_12.beads',
+    )
+    count, _ = bdd_count_layered(beads)
+
+so the size limit is set by the disk, not RAM. The counting and sampling
+passes of bdd_vector work on the mapped table a layer at a time, and so
+does reduce_bead_table_on_disk, which reduces it from the bottom up into
+another file (reduce_beads would keep dicts and sets over all the beads in
+memory):
+
+    reduced = reduce_bead_table_on_disk('grid_12.beads', 'grid_12.reduced')
+"""
+
+import heapq
+import os
+import shutil
+import struct
+import tempfile
+from array import array
+
+import numpy
+
+from bead_table import TYPECODE, load_bead_table, write_header
+from instrument import make_depth_timer
+from connection import (
+    TRUE_SINK_INDEX, FALSE_SINK_INDEX,
+    label_chr, make_frontier_steps, make_expander,
+)
+
+# state records are a length followed by the packed state; bucket records are
+# prefixed with the position the state first appeared at. branch records are
+# a position and the index of the state (or sink) there
+LENGTH_FORMAT = '<I'
+BUCKET_FORMAT = '<qI'
+BRANCH_FORMAT = '<qq'
+# beads and branches are written this many at a time
+COPY_CHUNK = 1 << 16
+
+def make_state_codec(to_chr):
+    """
+    return (pack, unpack) converting states to and from byte strings
+    """
+    if to_chr is chr:
+        identity = lambda state : state
+        return identity, identity
+    return (
+        lambda state : state.encode('utf-8'),
+        lambda packed : packed.decode('utf-8'),
+    )
+
+def write_record(out_file, packed):
+    out_file.write(struct.pack(LENGTH_FORMAT, len(packed)) + packed)
+
+def read_records(in_file):
+    """
+    yield the packed states of a state file, in order
+    """
+    size = struct.calcsize(LENGTH_FORMAT)
+    while True:
+        prefix = in_file.read(size)
+        if not prefix:
+            return
+        (length, ) = struct.unpack(LENGTH_FORMAT, prefix)
+        yield in_file.read(length)
+
+def read_bucket(in_file):
+    """
+    yield the (position, packed state) records of a bucket file, in order
+    """
+    size = struct.calcsize(BUCKET_FORMAT)
+    while True:
+        prefix = in_file.read(size)
+        if not prefix:
+            return
+        position, length = struct.unpack(BUCKET_FORMAT, prefix)
+        yield position, in_file.read(length)
+
+def read_branches(in_file):
+    """
+    yield the (position, index) records of a branch file, in order
+    """
+    size = struct.calcsize(BRANCH_FORMAT)
+    while True:
+        record = in_file.read(size)
+        if not record:
+            return
+        yield struct.unpack(BRANCH_FORMAT, record)
+
+def make_branch_writer(raw_lows, raw_highs):
+    """
+    return (write, flush). write(index) gives the branch at the next
+    position, the low and high branches of each bead in turn, which are
+    appended to raw_lows and raw_highs COPY_CHUNK at a time. flush writes
+    what is left and returns the numbers of branches to the (true, false)
+    sinks
+    """
+    branches = array(TYPECODE)
+    sinks = [0, 0]
+    def flush():
+        sinks[0] += branches.count(TRUE_SINK_INDEX)
+        sinks[1] += branches.count(FALSE_SINK_INDEX)
+        branches[::2].tofile(raw_lows)
+        branches[1::2].tofile(raw_highs)
+        del branches[:]
+        return tuple(sinks)
+    def write(index):
+        branches.append(index)
+        if len(branches) >= 2 * COPY_CHUNK:
+            flush()
+    return write, flush
+
+def expand_in_memory(states, expand, pack, unpack, base, out_states,
+        write_branch):
+    """
+    expand the packed states of one depth, deduplicating the successors in a
+    dict. the successors are numbered from base and written to out_states,
+    and the branches of the beads passed to write_branch (see
+    make_branch_writer). returns the number of successors
+    """
+    cache = {
+        TRUE_SINK_INDEX : TRUE_SINK_INDEX,
+        FALSE_SINK_INDEX : FALSE_SINK_INDEX,
+    }
+    for packed in states:
+        for successor in expand(unpack(packed)):
+            index = cache.get(successor)
+            if index is None:
+                index = base + len(cache) - 2
+                cache[successor] = index
+                write_record(out_states, pack(successor))
+            write_branch(index)
+    return len(cache) - 2
+
+def expand_by_hashing(states, expand, pack, unpack, base, out_states,
+        write_branch, n_buckets, work_dir):
+    """
+    as expand_in_memory, but deduplicating the successors by external
+    hashing over n_buckets bucket files, so that only one bucket's states are
+    in memory at a time
+    """
+    # each state has a low and a high successor, at positions 2 j and 2 j + 1
+    new_file = lambda : tempfile.TemporaryFile(dir = work_dir)
+    buckets = [new_file() for _ in xrange(n_buckets)]
+    # branches straight to a sink need no lookup
+    sink_branches = new_file()
+    position = 0
+    for packed in states:
+        for successor in expand(unpack(packed)):
+            if successor in (TRUE_SINK_INDEX, FALSE_SINK_INDEX):
+                sink_branches.write(
+                    struct.pack(BRANCH_FORMAT, position, successor)
+                )
+            else:
+                packed_successor = pack(successor)
+                buckets[hash(packed_successor) % n_buckets].write(
+                    struct.pack(BUCKET_FORMAT, position, len(packed_successor))
+                    + packed_successor
+                )
+            position += 1
+
+    # deduplicate each bucket on its own. records are in order of position,
+    # so each bucket's distinct states come out in order of first appearance
+    distinct = []
+    for bucket in buckets:
+        bucket.seek(0)
+        seen = set()
+        out_bucket = new_file()
+        for position, packed in read_bucket(bucket):
+            if packed not in seen:
+                seen.add(packed)
+                out_bucket.write(
+                    struct.pack(BUCKET_FORMAT, position, len(packed)) + packed
+                )
+        out_bucket.seek(0)
+        distinct.append(out_bucket)
+
+    # merging the buckets by position of first appearance numbers the
+    # successors just as make_connectedness_tree would. each bucket's
+    # indices are written back to a file of its own, in the order of its
+    # distinct states
+    indices = [new_file() for _ in xrange(n_buckets)]
+    def tagged(b):
+        for position, packed in read_bucket(distinct[b]):
+            yield position, b, packed
+    n_successors = 0
+    for _, b, packed in heapq.merge(*[tagged(b) for b in xrange(n_buckets)]):
+        array(TYPECODE, [base + n_successors]).tofile(indices[b])
+        n_successors += 1
+        write_record(out_states, packed)
+
+    # look up the index of every branch into each bucket, giving its
+    # branches in order of position
+    resolved = []
+    for bucket, out_bucket, bucket_indices in zip(buckets, distinct, indices):
+        out_bucket.seek(0)
+        bucket_indices.seek(0)
+        index_of = array(TYPECODE)
+        index_of.fromstring(bucket_indices.read())
+        index_of = dict(zip(
+            (packed for (_, packed) in read_bucket(out_bucket)), index_of,
+        ))
+        out_bucket.close()
+        bucket_indices.close()
+        bucket.seek(0)
+        branches = new_file()
+        for position, packed in read_bucket(bucket):
+            branches.write(
+                struct.pack(BRANCH_FORMAT, position, index_of[packed])
+            )
+        bucket.close()
+        branches.seek(0)
+        resolved.append(branches)
+    sink_branches.seek(0)
+    resolved.append(sink_branches)
+
+    for _, index in heapq.merge(*[read_branches(r) for r in resolved]):
+        write_branch(index)
+    for branches in resolved:
+        branches.close()
+    return n_successors
+
+def write_final_table(file_name, raw_files, n_beads, n_edges, connected = True):
+    """
+    write the beads, numbered by index in raw_files, as a bead table with the
+    usual keys : index i becomes key s - 1 - i, after the two sinks. the raw
+    files are read backwards a chunk at a time. with no beads the table is
+    the True sink if connected is set, else just the False sink
+    """
+    s = n_beads + 2 if n_beads or connected else 1
+    def r(i):
+        if i == TRUE_SINK_INDEX:
+            return 1
+        elif i == FALSE_SINK_INDEX:
+            return 0
+        return s - 1 - i
+    itemsize = array(TYPECODE).itemsize
+    out_file = open(file_name, 'wb')
+    try:
+        write_header(out_file, s, n_edges)
+        sinks = ([n_edges, n_edges], [0, 1], [0, 1])
+        for (raw, sink_entries, remap) in zip(raw_files, sinks, (False, True, True)):
+            array(TYPECODE, sink_entries[:s]).tofile(out_file)
+            end = n_beads
+            while end > 0:
+                start = max(0, end - COPY_CHUNK)
+                raw.seek(start * itemsize)
+                chunk = array(TYPECODE)
+                chunk.fromfile(raw, end - start)
+                chunk.reverse()
+                if remap:
+                    chunk = array(TYPECODE, [r(i) for i in chunk])
+                chunk.tofile(out_file)
+                end = start
+    finally:
+        out_file.close()
+
+def make_connectedness_tree_on_disk(vertex_order, edge_order, frontiers,
+        file_name, work_dir = None, max_states = 1 << 20, verbose = False,
+        monitor = None):
+    """
+    build the (unreduced) connectedness BDD as make_connectedness_tree does,
+    keeping the beads and states on disk, and write it to file_name (see
+    bead_table.save_bead_table). returns the table, memory-mapped.
+
+    scratch files go in a temporary directory inside work_dir (by default
+    the system temporary directory), removed afterwards. depths that could
+    make more than max_states new states are deduplicated by external
+    hashing, so roughly max_states states are in memory at once, and
+    nothing else grows with the size of a layer. monitor is as for
+    make_connectedness_tree
+    """
+    n_vertices = len(vertex_order)
+    n_edges = len(edge_order)
+    steps = make_frontier_steps(n_vertices, edge_order, frontiers)
+    to_chr = label_chr(max([len(f) for f in frontiers] + [0]) + 2)
+    pack, unpack = make_state_codec(to_chr)
+    if monitor is not None:
+        record = make_depth_timer(TRUE_SINK_INDEX, FALSE_SINK_INDEX)
+
+    scratch = tempfile.mkdtemp(dir = work_dir)
+    try:
+        raw_files = [
+            open(os.path.join(scratch, name), 'w+b')
+            for name in ('var', 'lo', 'hi')
+        ]
+        # nothing is on the frontier before the first edge
+        states = open(os.path.join(scratch, 'states_0'), 'w+b')
+        write_record(states, pack(to_chr(0)[:0]))
+        n_states = 1
+        n_beads = 0
+        for depth, step in enumerate(steps):
+            if verbose:
+                print 'depth %d: beads %d, states %d' % (
+                    depth,
+                    n_beads,
+                    n_states
+                )
+            expand = make_expander(step, to_chr)
+            states.seek(0)
+            next_states = open(
+                os.path.join(scratch, 'states_%d' % (depth + 1)), 'w+b',
+            )
+            base = n_beads + n_states
+            n_buckets = -(-2 * n_states // max_states)
+            write_branch, flush_branches = make_branch_writer(*raw_files[1:])
+            if n_buckets <= 1:
+                n_next = expand_in_memory(
+                    read_records(states), expand, pack, unpack, base,
+                    next_states, write_branch,
+                )
+            else:
+                n_next = expand_by_hashing(
+                    read_records(states), expand, pack, unpack, base,
+                    next_states, write_branch, n_buckets, scratch,
+                )
+            sinks = flush_branches()
+            for start in xrange(0, n_states, COPY_CHUNK):
+                chunk = min(COPY_CHUNK, n_states - start)
+                (array(TYPECODE, [depth]) * chunk).tofile(raw_files[0])
+            if monitor is not None:
+                monitor(record(depth, n_states, n_next, sinks = sinks))
+            n_beads += n_states
+            states.close()
+            os.remove(states.name)
+            states, n_states = next_states, n_next
+        states.close()
+
+        for raw in raw_files:
+            raw.flush()
+        # with no edges, only a single vertex is connected
+        write_final_table(
+            file_name, raw_files, n_beads, n_edges,
+            connected = n_edges > 0 or n_vertices <= 1,
+        )
+        for raw in raw_files:
+            raw.close()
+    finally:
+        shutil.rmtree(scratch)
+    return load_bead_table(file_name)
+
+def layer_end(var, start):
+    """
+    the end of the layer of keys starting at start, in a table whose
+    variables do not increase with the key (after the sinks)
+    """
+    v = var[start]
+    low, high = start + 1, len(var)
+    while low < high:
+        middle = (low + high) // 2
+        if var[middle] == v:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+def reduce_bead_table_on_disk(file_name, out_file_name, work_dir = None,
+        verbose = False):
+    """
+    reduce the BDD in the bead table file file_name (as written by
+    make_connectedness_tree_on_disk, with every bead reachable from the
+    root and the keys of each variable together), writing the reduced BDD
+    to out_file_name. returns it, memory-mapped.
+
+    the table is read a layer at a time from the bottom up, as Algorithm R
+    does. the new key of every old key is kept in a memory-mapped scratch
+    file, so only the unique table of one layer is in memory, and the
+    reduced beads are written out as they are made, in increasing key
+    order
+    """
+    beads = load_bead_table(file_name)
+    s = len(beads)
+    if s < 3:
+        shutil.copyfile(file_name, out_file_name)
+        return load_bead_table(out_file_name)
+    var, lo, hi = beads.var, beads.lo, beads.hi
+    n = int(var[0])
+
+    scratch = tempfile.mkdtemp(dir = work_dir)
+    try:
+        new_key = numpy.memmap(
+            os.path.join(scratch, 'keys'), dtype = numpy.int64, mode = 'w+',
+            shape = (s, ),
+        )
+        new_key[:2] = (0, 1)
+        raw_files = [
+            open(os.path.join(scratch, name), 'w+b')
+            for name in ('var', 'lo', 'hi')
+        ]
+        n_out = 2
+        start = 2
+        while start < s:
+            end = layer_end(var, start)
+            v = int(var[start])
+            if verbose:
+                print 'reduce : variable %d, beads %d' % (v, end - start)
+            unique = {}
+            keys = array(TYPECODE)
+            out = [array(TYPECODE) for _ in xrange(3)]
+            lows = new_key[lo[start:end]].tolist()
+            highs = new_key[hi[start:end]].tolist()
+            for l, h in zip(lows, highs):
+                if l == h:
+                    keys.append(l)
+                    continue
+                key = unique.get((l, h))
+                if key is None:
+                    key = unique[(l, h)] = n_out
+                    n_out += 1
+                    out[0].append(v)
+                    out[1].append(l)
+                    out[2].append(h)
+                keys.append(key)
+            new_key[start:end] = keys
+            for raw, column in zip(raw_files, out):
+                column.tofile(raw)
+            start = end
+
+        # nb every bead made is reachable, so the root is the last one made,
+        # unless the whole BDD reduced to a sink
+        root = int(new_key[s - 1])
+        s_out = n_out if root > 1 else root + 1
+        out_file = open(out_file_name, 'wb')
+        try:
+            write_header(out_file, s_out, n)
+            sinks = ([n, n], [0, 1], [0, 1])
+            for raw, sink_entries in zip(raw_files, sinks):
+                array(TYPECODE, sink_entries[:s_out]).tofile(out_file)
+                raw.seek(0)
+                remaining = s_out - 2
+                while remaining > 0:
+                    chunk = array(TYPECODE)
+                    chunk.fromfile(raw, min(COPY_CHUNK, remaining))
+                    chunk.tofile(out_file)
+                    remaining -= len(chunk)
+                raw.close()
+        finally:
+            out_file.close()
+        del new_key
+    finally:
+        shutil.rmtree(scratch)
+    return load_bead_table(out_file_name)
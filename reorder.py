@@ -0,0 +1,218 @@
+"""
+Dynamic variable reordering of reduced BDDs by sifting.
+
+The variable order of a connectedness BDD is fixed by order_edges, but a
+different order can make the reduced BDD very much smaller. Here a reduced
+BDD is loaded into a mutable, level by level structure in which two
+adjacent levels can be swapped in place, touching only the beads on those
+two levels. Rudell's sifting algorithm then moves each variable in turn
+through every level, and leaves it where the BDD was smallest.
+
+The result is a BDD dict with an extra entry : order[v] is the original
+variable now tested at level v. Use restore_variable_order to map solutions
+(or rows of a solution matrix) back to the original variables, eg edges:
+
+    sifted = sift(reduce_beads(beads), time_budget = 10.0)
+    x = bdd_sample_solutions(sifted, 100, rng)
+    x = restore_variable_order(x, sifted['order'])
+"""
+
+import time
+
+from bead_table import BeadTable
+from bdd import as_bdd
+
+class LevelBDD(object):
+    """
+    a reduced BDD that supports swapping adjacent levels in place.
+
+    nodes are numbered as they are made, with 0 and 1 the sinks. level[k] is
+    the level node k tests, lo[k] and hi[k] its branches and ref[k] its
+    number of parents (plus one for the root). unique[l] maps (lo, hi) to the
+    node at level l with those branches. dead nodes have level None
+    """
+    def __init__(self, bdd):
+        bdd = as_bdd(bdd)
+        s, dag = bdd['s'], bdd['dag']
+        self.n = dag[0][0]
+        self.order = list(bdd.get('order', range(self.n)))
+        self.level = [self.n, self.n]
+        self.lo = [0, 1]
+        self.hi = [0, 1]
+        self.ref = [0, 0]
+        self.unique = [{} for _ in xrange(self.n)]
+        self.size = 0
+        # nb make_node reduces the BDD as it goes, in case it was not already
+        r = {0 : 0, 1 : 1}
+        for k in xrange(2, s):
+            v, l, h = dag[k]
+            r[k] = self.make_node(v, r[l], r[h])
+        self.root = r[s - 1]
+        self.ref[self.root] += 1
+
+    def make_node(self, level, l, h):
+        if l == h:
+            return l
+        k = self.unique[level].get((l, h))
+        if k is None:
+            k = len(self.level)
+            self.level.append(level)
+            self.lo.append(l)
+            self.hi.append(h)
+            self.ref.append(0)
+            self.unique[level][(l, h)] = k
+            self.ref[l] += 1
+            self.ref[h] += 1
+            self.size += 1
+        return k
+
+    def release(self, k):
+        """
+        drop one reference to k, deleting it (and so on down) if it is dead
+        """
+        stack = [k]
+        while stack:
+            k = stack.pop()
+            self.ref[k] -= 1
+            if k < 2 or self.ref[k] > 0:
+                continue
+            del self.unique[self.level[k]][(self.lo[k], self.hi[k])]
+            self.level[k] = None
+            self.size -= 1
+            stack.append(self.lo[k])
+            stack.append(self.hi[k])
+
+    def cofactors(self, k, level):
+        if self.level[k] == level:
+            return self.lo[k], self.hi[k]
+        return k, k
+
+    def swap(self, l):
+        """
+        swap the variables at levels l and l + 1, in place. nodes at level l
+        keep their numbers, so nothing above level l needs to change
+        """
+        upper = self.unique[l]
+        lower = self.unique[l + 1]
+        # nodes testing the lower variable do not depend on the upper one, so
+        # they simply move up a level
+        self.unique[l] = {}
+        self.unique[l + 1] = {}
+        for (lh, k) in lower.iteritems():
+            self.level[k] = l
+            self.unique[l][lh] = k
+        # nodes testing the upper variable that do not depend on the lower
+        # one simply move down a level. these go first, so that the new nodes
+        # made below can share them
+        dependent = []
+        for ((f0, f1), k) in upper.iteritems():
+            if self.level[f0] == l or self.level[f1] == l:
+                # nb the lower nodes are at level l by now
+                dependent.append(k)
+            else:
+                self.level[k] = l + 1
+                self.unique[l + 1][(f0, f1)] = k
+        # the rest are rebuilt as a node testing the lower variable, whose
+        # branches test the upper one
+        released = []
+        for k in dependent:
+            f0, f1 = self.lo[k], self.hi[k]
+            f00, f01 = self.cofactors(f0, l)
+            f10, f11 = self.cofactors(f1, l)
+            g0 = self.make_node(l + 1, f00, f10)
+            g1 = self.make_node(l + 1, f01, f11)
+            self.ref[g0] += 1
+            self.ref[g1] += 1
+            self.lo[k], self.hi[k] = g0, g1
+            self.unique[l][(g0, g1)] = k
+            released.append(f0)
+            released.append(f1)
+        for k in released:
+            self.release(k)
+        self.order[l], self.order[l + 1] = self.order[l + 1], self.order[l]
+
+    def move(self, l, target):
+        """
+        move the variable at level l to level target by adjacent swaps
+        """
+        while l < target:
+            self.swap(l)
+            l += 1
+        while l > target:
+            self.swap(l - 1)
+            l -= 1
+
+    def export(self):
+        """
+        return the BDD as a dict of s, dag (a BeadTable with monotone keys)
+        and order
+        """
+        table = BeadTable()
+        table.append(self.n, 0, 0)
+        table.append(self.n, 1, 1)
+        r = {0 : 0, 1 : 1}
+        for l in xrange(self.n - 1, -1, -1):
+            for k in self.unique[l].itervalues():
+                r[k] = table.append(l, r[self.lo[k]], r[self.hi[k]])
+        if self.root == 0:
+            table = BeadTable.from_dict({0 : table[0]})
+        return dict(s = len(table), dag = table, order = list(self.order))
+
+def sift(bdd, max_growth = 1.2, time_budget = None, verbose = False):
+    """
+    reorder the variables of a reduced BDD by Rudell's sifting, returning a
+    BDD dict with an order entry (see above). variables are sifted in order
+    of decreasing level size; each is moved down to the bottom then up to the
+    top, abandoning a direction once the BDD grows beyond max_growth times
+    the best size seen, and then settles at the best level found. stops early
+    once time_budget seconds have passed
+    """
+    levels = LevelBDD(bdd)
+    n = levels.n
+    if time_budget is not None:
+        deadline = time.time() + time_budget
+    def out_of_time():
+        return time_budget is not None and time.time() >= deadline
+
+    if verbose:
+        print 'sift : initial size %d' % levels.size
+    by_size = sorted(
+        levels.order,
+        key = lambda v : -len(levels.unique[levels.order.index(v)]),
+    )
+    for v in by_size:
+        if out_of_time():
+            break
+        l = levels.order.index(v)
+        best_size, best_level = levels.size, l
+        limit = max_growth * best_size
+        # down...
+        while l < n - 1 and levels.size <= limit and not out_of_time():
+            levels.swap(l)
+            l += 1
+            if levels.size < best_size:
+                best_size, best_level = levels.size, l
+        # ...then up
+        while l > 0 and levels.size <= limit and not out_of_time():
+            levels.swap(l - 1)
+            l -= 1
+            if levels.size < best_size:
+                best_size, best_level = levels.size, l
+        levels.move(l, best_level)
+        if verbose:
+            print 'sift : variable %d to level %d, size %d' % (
+                v, best_level, levels.size,
+            )
+    return levels.export()
+
+def restore_variable_order(solution, order):
+    """
+    map a solution of a reordered BDD (a list, or numpy array whose last axis
+    runs over the levels) back to the original variables
+    """
+    inverse = [0] * len(order)
+    for level, v in enumerate(order):
+        inverse[v] = level
+    if hasattr(solution, 'shape'):
+        return solution[..., inverse]
+    return [solution[inverse[v]] for v in xrange(len(order))]
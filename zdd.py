@@ -0,0 +1,271 @@
+"""
+Zero-suppressed decision diagrams (ZDDs), Knuth's AoCP Vol 4 Fascicle 1,
+section 7.1.4.
+
+A ZDD is stored exactly like a BDD : a dict of s and a dag of beads (or a
+BeadTable), key 0 the empty family and key 1 the family containing just
+the empty set, both testing the dummy variable n. The difference is what a
+skipped variable means. In a BDD a variable that is not tested on a path
+may take either value, hence the 2 ** (v_l - v_k - 1) factors in
+bdd_count_solutions; in a ZDD it must be 0. So a node whose high branch is
+the empty family is left out (rather than a node whose branches agree),
+and families of sparse sets, eg the edge sets of small connected
+subgraphs, have small ZDDs.
+
+As in connection.py, variables are numbered from v_first = 0. The ZDD of
+the connected spanning subgraphs comes straight from the frontier search,
+with make_connectedness_zdd. Both forms can be made from each other, so
+each query can use whichever is smaller:
+
+    bdd = reduce_beads(make_connectedness_tree(...))
+    zdd = bdd_to_zdd(bdd)
+    if len(zdd) < len(bdd):
+        count = zdd_count(zdd)
+"""
+
+from __future__ import division
+
+from array import array
+
+import numpy
+
+from bead_table import BeadTable, TYPECODE
+from bdd import as_bdd
+from connection import TRUE_SINK_INDEX, FALSE_SINK_INDEX, label_chr, \
+    make_frontier_steps, make_expander
+from instrument import make_depth_timer
+
+EMPTY = 0
+UNIT = 1
+
+def make_builder(n):
+    """
+    return (make_node, finish) for building a diagram bottom up. make_node
+    takes (v, l, h, zdd) and applies the BDD or ZDD reduction rule; finish
+    takes the root and returns the beads reachable from it, rekeyed 0, ...,
+    s - 1 in the order made
+    """
+    table = BeadTable()
+    table.append(n, 0, 0)
+    table.append(n, 1, 1)
+    unique = {}
+    def make_node(v, l, h, zdd):
+        if (h == EMPTY) if zdd else (l == h):
+            return l
+        key = unique.get((v, l, h))
+        if key is None:
+            key = table.append(v, l, h)
+            unique[(v, l, h)] = key
+        return key
+
+    def finish(root):
+        reachable = set([0, root])
+        stack = [root]
+        while stack:
+            key = stack.pop()
+            if key < 2:
+                continue
+            for child in (table.lo[key], table.hi[key]):
+                if child not in reachable:
+                    reachable.add(child)
+                    stack.append(child)
+        if root == 0:
+            return BeadTable.from_dict({0 : table[0]})
+        r = {}
+        out = BeadTable()
+        for key in sorted(reachable | set([1])):
+            v, l, h = table[key]
+            r[key] = out.append(v, r.get(l, l), r.get(h, h))
+        return out
+    return make_node, finish
+
+def convert(dd, from_zdd, v_first):
+    """
+    convert a BDD to a ZDD for the same family of sets (or the other way if
+    from_zdd is set). returns a BeadTable
+    """
+    dag = as_bdd(dd)['dag']
+    s = len(dag)
+    n = dag[0][0]
+    make_node, finish = make_builder(n)
+    to_zdd = not from_zdd
+    # nb the value of a variable skipped by the input is free in a BDD, and
+    # 0 in a ZDD. made[k] is the output node for input node k seen from the
+    # variable it tests, and padded[(k, i)] the node for k seen from level
+    # i, where the variables i, ..., v_k - 1 are skipped
+    made = {EMPTY : EMPTY, UNIT : UNIT}
+    padded = {}
+    def seen_from(k, i):
+        v = n if k < 2 else dag[k][0]
+        if k == EMPTY or i == v:
+            return made[k]
+        node = padded.get((k, i))
+        if node is not None:
+            return node
+        node = made[k]
+        for j in xrange(v - 1, i - 1, -1):
+            if (k, j) in padded:
+                node = padded[(k, j)]
+                continue
+            if from_zdd:
+                # skipped by the ZDD, so x_j is 0
+                node = make_node(j, node, EMPTY, to_zdd)
+            else:
+                # skipped by the BDD, so x_j is free
+                node = make_node(j, node, node, to_zdd)
+            padded[(k, j)] = node
+        return node
+
+    for k in xrange(2, s):
+        v, l, h = dag[k]
+        made[k] = make_node(v, seen_from(l, v + 1), seen_from(h, v + 1), to_zdd)
+    root = seen_from(s - 1, v_first) if s > 1 else EMPTY
+    return finish(root)
+
+def bdd_to_zdd(bdd, v_first = 0):
+    """
+    return the ZDD (as a BeadTable) of the family of solutions of the BDD
+    """
+    return convert(bdd, False, v_first)
+
+def zdd_to_bdd(zdd, v_first = 0):
+    """
+    return the reduced BDD (as a BeadTable) of the family given by the ZDD
+    """
+    return convert(zdd, True, v_first)
+
+def make_connectedness_zdd(vertex_order, edge_order, frontiers,
+        verbose = False, monitor = None):
+    """
+    the reduced ZDD of the connected spanning subgraphs, as a BeadTable.
+
+    the states of each depth are expanded as by make_connectedness_tree,
+    keeping the branches of each state in arrays by index. those are then
+    made into ZDD nodes from the bottom up, with the ZDD rule in place of
+    the BDD one : a state whose high branch is False stands for its low
+    branch, with its edge left out, while a state whose branches agree is
+    kept. a branch to True at depth d means the graph is already
+    connected, whatever the remaining edges, so it becomes a chain of
+    don't care nodes testing each of them. monitor is as for
+    make_connectedness_tree
+    """
+    n_vertices = len(vertex_order)
+    n_edges = len(edge_order)
+    steps = make_frontier_steps(n_vertices, edge_order, frontiers)
+    to_chr = label_chr(max([len(f) for f in frontiers] + [0]) + 2)
+    if monitor is not None:
+        record = make_depth_timer(TRUE_SINK_INDEX, FALSE_SINK_INDEX)
+
+    # the branches of the state with index i are lows[i] and highs[i], and
+    # states of depth d have indices from layer_starts[d]
+    lows = array(TYPECODE)
+    highs = array(TYPECODE)
+    layer_starts = []
+    # nothing is on the frontier before the first edge
+    states = [to_chr(0)[:0]]
+    for depth, step in enumerate(steps):
+        if verbose:
+            print 'depth %d: states %d' % (depth, len(states))
+        layer_starts.append(len(lows))
+        expand = make_expander(step, to_chr)
+        cache = {
+            TRUE_SINK_INDEX : TRUE_SINK_INDEX,
+            FALSE_SINK_INDEX : FALSE_SINK_INDEX,
+        }
+        next_states = []
+        base = len(lows) + len(states)
+        for state in states:
+            for branches, successor in zip((lows, highs), expand(state)):
+                index = cache.get(successor)
+                if index is None:
+                    index = cache[successor] = base + len(next_states)
+                    next_states.append(successor)
+                branches.append(index)
+        if monitor is not None:
+            start = layer_starts[-1]
+            monitor(record(
+                depth, len(states), len(next_states), lows[start:], highs[start:],
+            ))
+        states = next_states
+
+    make_node, finish = make_builder(n_edges)
+    # chains[j] is the node for "anything goes" over the edges j, ...
+    chains = [UNIT]
+    def chain(j):
+        while n_edges - len(chains) >= j:
+            k = n_edges - len(chains)
+            chains.append(make_node(k, chains[-1], chains[-1], True))
+        return chains[n_edges - j]
+    node_of = array(TYPECODE, [EMPTY]) * len(lows)
+    def branch_node(i, depth):
+        if i == FALSE_SINK_INDEX:
+            return EMPTY
+        elif i == TRUE_SINK_INDEX:
+            return chain(depth + 1)
+        return node_of[i]
+    ends = layer_starts[1:] + [len(lows)]
+    for depth in xrange(len(layer_starts) - 1, -1, -1):
+        for i in xrange(layer_starts[depth], ends[depth]):
+            node_of[i] = make_node(
+                depth,
+                branch_node(lows[i], depth),
+                branch_node(highs[i], depth),
+                True,
+            )
+    if n_edges:
+        root = node_of[0]
+    else:
+        # with no edges, only a single vertex is connected
+        root = UNIT if n_vertices <= 1 else EMPTY
+    return finish(root)
+
+def zdd_count(zdd, c = None):
+    """
+    count the sets in the family given by the ZDD, exactly. if c is given,
+    it is a list or map that will tabulate the count for each bead
+    """
+    dag = as_bdd(zdd)['dag']
+    s = len(dag)
+    if c is None:
+        c = [0] * s
+    c[0] = 0
+    if s > 1:
+        c[1] = 1
+    for k in xrange(2, s):
+        _, l, h = dag[k]
+        # nb no powers of 2 : skipped variables are 0
+        c[k] = c[l] + c[h]
+    return c[s - 1]
+
+def zdd_sample_solutions(zdd, n_samples, rng, v_first = 0, packed = False):
+    """
+    draw n_samples sets uniformly from the family given by the ZDD, returning
+    them as the rows of an (n_samples, n_vars) boolean matrix (or packed with
+    numpy.packbits), as bdd_vector.bdd_sample_solutions does for BDDs
+    """
+    dag = as_bdd(zdd)['dag']
+    if not isinstance(dag, BeadTable):
+        dag = BeadTable.from_dict(dag)
+    var, lo, hi = dag.as_numpy()
+    s = len(var)
+    c = [0] * s
+    if s < 2 or zdd_count(dag, c) == 0:
+        raise ValueError('there are no solutions')
+    p_high = numpy.zeros(s)
+    for k in xrange(2, s):
+        p_high[k] = c[int(hi[k])] / c[k] if c[k] else 0.0
+    uniform = getattr(rng, 'random', None) or rng.random_sample
+
+    n_vars = int(var[0]) - v_first
+    x = numpy.zeros((n_samples, n_vars), dtype = numpy.bool_)
+    k = numpy.empty(n_samples, dtype = lo.dtype)
+    k[:] = s - 1
+    for i in xrange(n_vars):
+        testing = var[k] == i + v_first
+        # variables skipped by the ZDD stay 0
+        bit = testing & (uniform(n_samples) < p_high[k])
+        x[:, i] = bit
+        k = numpy.where(testing, numpy.where(bit, hi[k], lo[k]), k)
+    if packed:
+        return numpy.packbits(x, axis = 1)
+    return x